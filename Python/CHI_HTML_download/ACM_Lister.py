@@ -1,4 +1,9 @@
+import codecs
+import concurrent.futures
 import csv
+import json
+import os
+import re
 
 import bibtexparser
 import requests
@@ -6,69 +11,156 @@ import requests
 
 # file for processing the .bib file from the chi/database website into a csv with sessions and keywords
 
+# can be pointed to the stand-in server of replay.py for benchmarks
+acm_base_url = "https://dl.acm.org"
+# proceedings of the years that have sessions
+PROCEEDINGS = {2021: "10.1145/3411764",
+               2022: "10.1145/3491102",
+               2023: "10.1145/3544548",
+               2024: "10.1145/3613904"}
+# parsed session dicts are stored here per proceedings DOI, delete a file (or the folder) to fetch it again
+session_cache_folder = "session_cache"
+# additionally write a typed .parquet file next to every csv (needs pyarrow)
+write_parquet = False
+
+# a "SESSION: <name>" text ends at the next tag, the DOIs of a session are listed in the value attribute before it
+TOC_TOKENS = re.compile(r'value="([^"]*)"|(SESSION[^<]*)')
+
+
+def decode_chunks(chunks, encoding="UTF-8"):
+    # multi-byte characters can be split between chunks, the decoder keeps the bytes until the rest arrives and
+    # the final call raises on a truncated sequence at the end instead of dropping it
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+
+def toc_tokens(chunks):
+    # single pass over the proceedings page, each chunk is scanned up to its last tag start and never copied again
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        cut = buffer.rfind("<")
+        if cut > 0:
+            yield from TOC_TOKENS.finditer(buffer, 0, cut)
+            buffer = buffer[cut:]
+    yield from TOC_TOKENS.finditer(buffer)
+
+
+def parse_session_tokens(chunks):
+    session_dict = {}
+    last_value = None
+    for token in toc_tokens(chunks):
+        if token.group(1) is not None:
+            last_value = token.group(1)
+        elif last_value is not None:
+            for doi in last_value.split(","):
+                session_dict.update({doi: token.group(2)})
+            # the DOIs of the next session follow after this session name
+            last_value = None
+    return session_dict
+
+
 def get_session_dict(year):
+    proceedings_doi = PROCEEDINGS[year]
+    cache_file = os.path.join(session_cache_folder, proceedings_doi.replace("/", "_") + ".json")
+    if os.path.isfile(cache_file):
+        with open(cache_file, "r", encoding="utf-8") as f:
+            return json.load(f)
     print("getting session id for " + str(year))
-    urls = {2021: "https://dl.acm.org/doi/proceedings/10.1145/3411764",
-            2022: "https://dl.acm.org/doi/proceedings/10.1145/3491102",
-            2023: "https://dl.acm.org/doi/proceedings/10.1145/3544548",
-            2024: "https://dl.acm.org/doi/proceedings/10.1145/3613904"}
     # Send GET request
-    response = requests.get(urls[year])
     session_dict = {}
-    if response.status_code == 200:
-        content = str(response.content, encoding="UTF-8")
-        base_index = 0
-        while content[base_index:].find("SESSION") >= 0:
-            sessionindex_start = content[base_index:].find("SESSION") + base_index
-            sessionindex_stop = content[sessionindex_start:].find("<") + sessionindex_start
-            valueindex_start = content[base_index:sessionindex_start].rfind('value="') + 7 + base_index
-            valueindex_stop = content[valueindex_start:].find('"') + valueindex_start
-            base_index = sessionindex_stop
-            Sessionname = (content[sessionindex_start:sessionindex_stop])
-            doilist = (content[valueindex_start:valueindex_stop]).split(",")
-            for doi in doilist:
-                session_dict.update({doi: Sessionname})
-    else:
-        print(response.status_code)
+    with requests.get(acm_base_url + "/doi/proceedings/" + proceedings_doi, stream=True) as response:
+        if response.status_code != 200:
+            print(response.status_code)
+            return session_dict
+        session_dict = parse_session_tokens(decode_chunks(response.iter_content(65536)))
+    os.makedirs(session_cache_folder, exist_ok=True)
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(session_dict, f)
     return session_dict
 
 
-def create_csv(filename, year):
-    # csv format: title, link, session, keywords
+def get_session_dicts(years):
+    # fetches the proceedings pages of all years at the same time
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(years) or 1) as executor:
+        return dict(zip(years, executor.map(get_session_dict, years)))
+
+
+def iter_bib_entries(filename, batch_size=200):
+    # yields the entries of a .bib file one after another without reading the whole file into memory,
+    # the raw entries are collected line by line and handed to bibtexparser in small batches
+    batch = []
+    entry_lines = []
+    depth = 0
     with open(filename, "r", encoding="utf-8") as bibtex_file:
-        bib_database = bibtexparser.parse_string(bibtex_file.read())
-        # clear file and add categories
-        with open(filename[:-3] + "csv", "w+", newline='', encoding="utf-8") as csvfile:
-            # Sessions only exist after 2020
-            if year > 2020:
-                header = ['Title', 'Link', "Session", 'Keywords']
-            else:
-                header = ['Title', 'Link', 'Keywords']
-            writer = csv.DictWriter(csvfile, fieldnames=header, delimiter=';')
-            writer.writeheader()
+        for line in bibtex_file:
+            if not entry_lines and not line.lstrip().startswith("@"):
+                continue  # text between entries
+            entry_lines.append(line)
+            depth += line.count("{") - line.count("}")
+            if depth <= 0:
+                batch.append("".join(entry_lines))
+                entry_lines = []
+                depth = 0
+                if len(batch) >= batch_size:
+                    yield from bibtexparser.parse_string("".join(batch)).entries
+                    batch = []
+    if entry_lines:
+        batch.append("".join(entry_lines))
+    if batch:
+        yield from bibtexparser.parse_string("".join(batch)).entries
+
 
+def create_csv(filename, year, session_dict=None):
+    # csv format: title, link, session, keywords
+    # Sessions only exist after 2020
+    if year > 2020:
+        header = ['Title', 'Link', "Session", 'Keywords']
+        if session_dict is None:
+            session_dict = get_session_dict(year)
+    else:
+        header = ['Title', 'Link', 'Keywords']
+    rows = []
+    # one buffered writer for the whole file
+    with open(filename[:-3] + "csv", "w", newline='', encoding="utf-8", buffering=1 << 20) as csvfile:
+        csvwriter = csv.writer(csvfile, delimiter=';')
+        csvwriter.writerow(header)
         # for each paper in the bib file
-        with open(filename[:-3] + "csv", "a+", newline='', encoding="utf-8") as csvfile:
+        for item in iter_bib_entries(filename):
+            try:
+                keywords = item.fields_dict["keywords"].value
+            except KeyError:
+                keywords = None
+            link = "https://dl.acm.org/doi/fullHtml/" + item.fields_dict["doi"].value
             if year > 2020:
-                session_dict = get_session_dict(year)
-            for item in bib_database.entries:
-                try:
-                    keywords = item.fields_dict["keywords"].value
-                except KeyError:
-                    keywords = None
-                link = "https://dl.acm.org/doi/fullHtml/" + item.fields_dict["doi"].value
-                if year > 2020:
-                    session = session_dict[item.fields_dict["doi"].value]
-                    paper_info = [item.get("title").value,
-                                  link,
-                                  session,
-                                  keywords]
-                else:
-                    paper_info = [item.get("title").value,
-                                  link,
-                                  keywords]
-                csvwriter = csv.writer(csvfile, delimiter=';')
-                csvwriter.writerow(paper_info)
+                session = session_dict[item.fields_dict["doi"].value]
+                paper_info = [item.get("title").value,
+                              link,
+                              session,
+                              keywords]
+            else:
+                paper_info = [item.get("title").value,
+                              link,
+                              keywords]
+            csvwriter.writerow(paper_info)
+            if write_parquet:
+                rows.append(paper_info)
+    if write_parquet:
+        write_parquet_file(filename[:-3] + "parquet", header, rows, year)
+    return filename[:-3] + "csv"
+
+
+def write_parquet_file(parquet_filename, header, rows, year):
+    # needs pyarrow (or fastparquet) installed in addition to pandas
+    import pandas as pd
+
+    df = pd.DataFrame(rows, columns=header).astype("string")
+    if "Session" in df:
+        df["Session"] = df["Session"].astype("category")
+    df.insert(0, "Year", pd.Series([year] * len(df), dtype="int16"))
+    df.to_parquet(parquet_filename, index=False)
 
 
 # dictionary of the files and their associated year
@@ -79,5 +171,12 @@ bibfile_dict = {
     '../../Data/Bibliography-Files/2022.bib': 2022,
     '../../Data/Bibliography-Files/2023.bib': 2023,
 }
-for filename, year in bibfile_dict.items():
-    create_csv(filename, year)
+
+if __name__ == "__main__":
+    session_dicts = get_session_dicts([year for year in bibfile_dict.values() if year > 2020])
+    # every year is converted in its own process
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = [executor.submit(create_csv, filename, year, session_dicts.get(year))
+                   for filename, year in bibfile_dict.items()]
+        for future in concurrent.futures.as_completed(futures):
+            print("written " + future.result())
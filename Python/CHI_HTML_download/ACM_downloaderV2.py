@@ -1,105 +1,166 @@
-import concurrent.futures
+import asyncio
 import csv
+import hashlib
 import os
-import re
 import sys
-import time
 from os.path import isfile, join
 from urllib.parse import urljoin
 
-import requests
 from bs4 import BeautifulSoup
 
+from archive_shards import ShardWriter
+from asset_store import AssetStore
+from download_engine import DOWNLOAD_MODES, DownloadEngine, DownloadError
+from manifest import DownloadManifest
+from telemetry import DownloadTelemetry
+
+# crawling mode, see download_engine.DOWNLOAD_MODES: "polite", "default" or "full_speed"
+download_mode = "polite"
+# images, stylesheets and scripts of all papers are shared in this folder
+asset_folder = "assets"
+# status, hash, ETag and Last-Modified of every downloaded page, used to resume and revalidate
+manifest_path = "download_manifest.sqlite"
+# only download the html documents of the papers and skip images, stylesheets and scripts
+text_only = False
+# write the raw html of the papers into compressed per-year shards in this folder instead of loose files,
+# e.g. "html_paper_zip" where quantitative_filtering expects the archives (implies text_only)
+archive_folder = None
+# latency histograms and throughput of the requests are written to this folder every 10 seconds
+# (download_telemetry.json and download_telemetry.prom), None to disable
+telemetry_folder = "telemetry"
+# instead of downloading papers, fetch the resources of pages that were downloaded with text_only = True
+fetch_missing_assets = False
+# re-request already downloaded pages with If-None-Match/If-Modified-Since and only rewrite them if they changed
+revalidate = False
+
+headers = {
+    "User-Agent": "Chrome/121.0.6167.139",
+}
 
-def savePage(url, year, pagepath='page'):
-    pagepath = year + "/" + url[-7:]
 
-    def savenRename(soup, pagefolder, url, tag, inner):
-        if not os.path.exists(pagefolder):  # create only once
-            os.mkdir(pagefolder)
-        for res in soup.findAll(tag):
-            if res.has_attr(inner):  # check inner tag (file object) MUST exists
-                try:
-                    filename, ext = os.path.splitext(os.path.basename(res[inner]))  # get name and extension
-                    ext = re.sub(r'\?.*', '', ext)
-                    filename = re.sub('\W+', '', filename) + ext  # clean special chars from name
-                    fileurl = urljoin(url, res.get(inner))
-                    filepath = os.path.join(pagefolder, filename)
-                    # rename html ref so can move html and folder of files anywhere
-                    res[inner] = os.path.join(os.path.basename(pagefolder), filename)
-                    if not os.path.isfile(filepath):  # was not downloaded
-                        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-                        with open(filepath, 'wb') as file:
-                            filebin = download_loop(fileurl)
-                            file.write(filebin.content)
-                except Exception as exc:
-                    print(exc, file=sys.stderr)
-
-    response = download_loop(url)
-    soup = BeautifulSoup(response.text, "html.parser")
-    path, _ = os.path.splitext(pagepath)
-    pagefolder = path + '_files'  # page contents folder
+async def saveAssets(engine, assets, soup, url, pagepath):
+    async def saveResource(res, inner):
+        try:
+            if os.path.isfile(os.path.join(os.path.dirname(pagepath), res[inner])):
+                return  # already points to a local copy
+            fileurl = urljoin(url, res.get(inner))
+            filepath = await assets.get(engine, fileurl)
+            # rename html ref to the shared asset store so the same resource is stored only once for all papers
+            res[inner] = os.path.relpath(filepath, os.path.dirname(pagepath)).replace(os.sep, "/")
+        except Exception as exc:
+            print(exc, file=sys.stderr)
+
     tags_inner = {'img': 'src', 'link': 'href', 'script': 'src'}  # tag&inner tags to grab
-    for tag, inner in tags_inner.items():  # saves resource files and rename refs
-        savenRename(soup, pagefolder, url, tag, inner)
-    with open(path + '.html', 'wb') as file:  # saves modified html doc
-        file.write(soup.prettify('utf-8'))
+    # fetch all resources of the page in parallel, the engine limits the overall concurrency
+    await asyncio.gather(*(saveResource(res, inner)
+                           for tag, inner in tags_inner.items()
+                           for res in soup.findAll(tag)
+                           if res.has_attr(inner)))  # check inner tag (file object) MUST exists
 
 
-def download_loop(url):
-    headers = {
-        "User-Agent": "Chrome/121.0.6167.139",
-    }
+async def savePage(engine, assets, manifest, shards, url, year, pagepath='page'):
+    pagepath = year + "/" + url[-7:]
+    doi = url.split("fullHtml/")[-1]
+    try:
+        response = await download_loop(engine, url, manifest.conditional_headers(url))
+    except DownloadError:
+        manifest.record(url, doi, year, "failed")
+        raise
+    path, _ = os.path.splitext(pagepath)
+    if response.status == 304:  # not modified since the last download
+        manifest.touch(url)
+        return
+    sha256 = hashlib.sha256(response.content).hexdigest()
+    entry = manifest.get(url)
+    stored = pagepath + '.html' in shards if shards is not None else os.path.isfile(path + '.html')
+    if entry is not None and entry["sha256"] == sha256 and stored:
+        manifest.touch(url)  # server did not support conditional requests but the page is unchanged
+        return
+    if shards is not None:
+        # raw html straight into the compressed archive of the year, no separate zipping step needed
+        shards.add(pagepath + '.html', response.content)
+    elif text_only:
+        # only the html document is needed for the analysis, resources can be fetched later with fetchMissingAssets
+        with open(path + '.html', 'wb') as file:
+            file.write(response.content)
+    else:
+        soup = BeautifulSoup(response.text, "html.parser")
+        await saveAssets(engine, assets, soup, url, path + '.html')
+        with open(path + '.html', 'wb') as file:  # saves modified html doc
+            file.write(soup.prettify('utf-8'))
+    manifest.record(url, doi, year, "done", len(response.content), sha256,
+                    response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+
+async def fetchMissingAssets(year, manifest):
+    # lazily downloads the resources of pages that were saved in text only mode and links them into the html
+    assets = AssetStore(asset_folder)
+    async with DownloadEngine(DOWNLOAD_MODES[download_mode], headers=headers) as engine:
+        try:
+            for url in sorted(manifest.completed(year)):
+                pagepath = year + "/" + url[-7:] + ".html"
+                if not os.path.isfile(pagepath):
+                    continue
+                with open(pagepath, 'rb') as file:
+                    soup = BeautifulSoup(file.read(), "html.parser")
+                await saveAssets(engine, assets, soup, url, pagepath)
+                with open(pagepath, 'wb') as file:
+                    file.write(soup.prettify('utf-8'))
+        finally:
+            assets.save_index()
+
+
+async def download_loop(engine, url, request_headers=None):
+    # retries, backoff and rate limiting are handled by the engine, raises DownloadError once it gives up
     print("downloading " + url)
-    download_unsuccessful = True
-    session = requests.Session()
-    while download_unsuccessful:
-        # Send GET request
-        response = session.get(url, headers=headers)
-        # Save the HTML
-        if response.status_code == 200:
-            return response
-        else:
-            print(response.status_code)
-            print("waiting 30 mins")
-            time.sleep(1800)
-
-
-def parallell_download(urllist, year):
-    # List of parameters
-    parameters_list = [(url, year) for url in urllist]
-    # Maximum number of concurrent tasks (adjust as needed)
-    max_workers = 1
-
-    # Create a ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit tasks to the executor for each parameter in the list
-        futures = [executor.submit(savePage, url, year) for url, year in parameters_list]
-
-        # Wait for all tasks to complete
-        for future in concurrent.futures.as_completed(futures):
-            # Retrieve any exceptions that might have occurred in the function
-            exc = future.exception()
-            if exc:
-                print(f'Function raised an exception: {exc}')
+    return await engine.fetch(url, headers=request_headers)
+
+
+async def parallell_download(urllist, year, manifest, shards=None):
+    # concurrency, rate limits and retries are configured by the download mode
+    assets = AssetStore(asset_folder)
+    telemetry = DownloadTelemetry(telemetry_folder) if telemetry_folder is not None else None
+    async with DownloadEngine(DOWNLOAD_MODES[download_mode], headers=headers, telemetry=telemetry) as engine:
+        try:
+            results = await asyncio.gather(*(savePage(engine, assets, manifest, shards, url, year) for url in urllist),
+                                           return_exceptions=True)
+        finally:
+            assets.save_index()
+    for exc in results:
+        # Retrieve any exceptions that might have occurred in the function
+        if isinstance(exc, Exception):
+            print(f'Function raised an exception: {exc}')
+    print(engine.stats)
+    return engine.stats
 
 
 # csv: title, link, keywords
-def start_download(csvfile, year_int):
+def start_download(csvfile, year_int, manifest):
     urllist = []
     year = str(year_int)
     with open(csvfile, 'r', encoding="UTF-8") as f:
         reader = csv.reader(f, delimiter=";")
         next(reader, None)
-        if not os.path.exists(year):  # year folder
-            os.mkdir(year)
-        # checks if files are present, if so we can skip downloading them again
-        present_files = [f for f in os.listdir(year) if isfile(join(year, f))]
+        # pages already in the manifest are skipped, unless they should be revalidated with a conditional request
+        downloaded = manifest.completed(year)
+        if archive_folder is not None:
+            shards = ShardWriter(archive_folder, year)
+            present_files = {name.split("/")[-1] for name in shards.members}
+        else:
+            shards = None
+            if not os.path.exists(year):  # year folder
+                os.mkdir(year)
+            # files downloaded before the manifest existed are skipped as well
+            present_files = {f for f in os.listdir(year) if isfile(join(year, f))}
         for row in reader:
-            if not row[1][-7:] + ".html" in present_files:
+            if revalidate or not (row[1] in downloaded or row[1][-7:] + ".html" in present_files):
                 urllist.append(row[1])
 
-    parallell_download(urllist, year)
+    try:
+        asyncio.run(parallell_download(urllist, year, manifest, shards))
+    finally:
+        if shards is not None:
+            shards.close()
     print("finished!")
 
 
@@ -110,5 +171,11 @@ bibfile_dict = {
     '../../Data/Bibliography-Files/2022.csv': 2022,
     '../../Data/Bibliography-Files/2023.csv': 2023,
 }
-for filename, year_int in bibfile_dict.items():
-    start_download(filename, year_int)
+
+if __name__ == "__main__":
+    download_manifest = DownloadManifest(manifest_path)
+    for filename, year_int in bibfile_dict.items():
+        if fetch_missing_assets:
+            asyncio.run(fetchMissingAssets(str(year_int), download_manifest))
+        else:
+            start_download(filename, year_int, download_manifest)
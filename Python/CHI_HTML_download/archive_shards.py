@@ -0,0 +1,193 @@
+import glob
+import json
+import os
+import re
+import struct
+import time
+import zipfile
+import zlib
+
+# file containing the per-year archive shards the downloader writes the raw html pages to
+# layout in the archive folder:
+#   <year>-000.zip, <year>-001.zip, ...  append-only zip shards, a shard is never modified once it is closed
+#   <year>.index.jsonl                   one line per stored page: member name, shard and offset of the member
+# the member names are <year>/<doi>.html, the same names the manually zipped <year>.zip archives use
+
+# local file header of a zip member, see the zip specification (APPNOTE.TXT 4.3.7)
+LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+
+
+def index_path(folder, year):
+    return os.path.join(folder, f"{year}.index.jsonl")
+
+
+def read_index(path):
+    # later lines win, so a page that was downloaded again points to its newest copy
+    members = {}
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    members[entry["name"]] = entry
+    return members
+
+
+def read_raw_member(shard_path, entry):
+    # reads a member by its offset, this works even if the shard has no central directory yet
+    with open(shard_path, "rb") as f:
+        f.seek(entry["offset"])
+        header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+        if header[0] != b"PK\x03\x04":
+            raise zipfile.BadZipFile(f"no zip member at offset {entry['offset']} in {shard_path}")
+        f.seek(header[9] + header[10], os.SEEK_CUR)  # skip file name and extra field
+        data = f.read(entry["compress_size"])
+    if entry["method"] == zipfile.ZIP_DEFLATED:
+        data = zlib.decompress(data, -15)
+    if zlib.crc32(data) != entry["crc"]:
+        raise zipfile.BadZipFile(f"bad crc for {entry['name']} in {shard_path}")
+    return data
+
+
+class ShardWriter:
+    """Streams pages into append-only, deflate compressed zip shards of one year"""
+
+    def __init__(self, folder, year, max_members=1000, compresslevel=6):
+        self.folder = folder
+        self.year = str(year)
+        self.max_members = max_members
+        self.compresslevel = compresslevel
+        os.makedirs(folder, exist_ok=True)
+        self.index_path = index_path(folder, year)
+        self.members = read_index(self.index_path)
+        self.shard_numbers = sorted(int(re.search(r"-(\d+)\.zip$", path).group(1))
+                                    for path in glob.glob(os.path.join(folder, f"{self.year}-[0-9][0-9][0-9].zip")))
+        self._repair()
+        self.index_file = open(self.index_path, "a", encoding="utf-8")
+        self.archive = None
+        self.shard_name = None
+        self.shard_members = 0
+
+    def __contains__(self, name):
+        return name in self.members
+
+    def _next_shard_name(self):
+        number = self.shard_numbers[-1] + 1 if self.shard_numbers else 0
+        self.shard_numbers.append(number)
+        return f"{self.year}-{number:03d}.zip"
+
+    def _repair(self):
+        # shards of a crashed run have no central directory, copy their members into a new, complete shard
+        broken = [f"{self.year}-{number:03d}.zip" for number in self.shard_numbers
+                  if not zipfile.is_zipfile(os.path.join(self.folder, f"{self.year}-{number:03d}.zip"))]
+        if not broken:
+            return
+        recovered = [entry for entry in self.members.values() if entry["shard"] in broken]
+        shard_name = self._next_shard_name()
+        with zipfile.ZipFile(os.path.join(self.folder, shard_name), "w", zipfile.ZIP_DEFLATED,
+                             compresslevel=self.compresslevel) as archive:
+            for entry in recovered:
+                try:
+                    data = read_raw_member(os.path.join(self.folder, entry["shard"]), entry)
+                except (zipfile.BadZipFile, zlib.error, struct.error) as exc:
+                    print(f"dropping {entry['name']}: {exc}")
+                    del self.members[entry["name"]]
+                    continue
+                self.members[entry["name"]] = self._write(archive, shard_name, entry["name"], data)
+        # rewrite the index without the broken shards, then remove them
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            for entry in self.members.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(self.index_path + ".tmp", self.index_path)
+        for shard in broken:
+            os.remove(os.path.join(self.folder, shard))
+            self.shard_numbers.remove(int(shard[-7:-4]))
+
+    def _write(self, archive, shard_name, name, data):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        archive.writestr(info, data, compresslevel=self.compresslevel)
+        archive.fp.flush()
+        return {"name": name, "shard": shard_name, "offset": info.header_offset, "compress_size": info.compress_size,
+                "file_size": info.file_size, "crc": info.CRC, "method": info.compress_type}
+
+    def add(self, name, data):
+        if self.archive is None or self.shard_members >= self.max_members:
+            self.close_shard()
+            self.shard_name = self._next_shard_name()
+            self.archive = zipfile.ZipFile(os.path.join(self.folder, self.shard_name), "w", zipfile.ZIP_DEFLATED,
+                                           compresslevel=self.compresslevel)
+            self.shard_members = 0
+        entry = self._write(self.archive, self.shard_name, name, data)
+        self.shard_members += 1
+        self.members[name] = entry
+        self.index_file.write(json.dumps(entry) + "\n")
+        self.index_file.flush()
+
+    def close_shard(self):
+        if self.archive is not None:
+            self.archive.close()  # writes the central directory
+            self.archive = None
+
+    def close(self):
+        self.close_shard()
+        self.index_file.close()
+
+
+class ShardReader:
+    """Read only view of the shards of one year, mimics the parts of zipfile.ZipFile used by the analysis scripts"""
+
+    def __init__(self, folder, year):
+        self.folder = folder
+        self.members = read_index(index_path(folder, year))
+        # sorted, so that seeded sampling does not depend on the order the pages were downloaded in
+        self.filelist = []
+        for name in sorted(self.members):
+            entry = self.members[name]
+            info = zipfile.ZipInfo(name)
+            info.CRC = entry["crc"]
+            info.file_size = entry["file_size"]
+            info.compress_size = entry["compress_size"]
+            self.filelist.append(info)
+
+    def infolist(self):
+        return self.filelist
+
+    def namelist(self):
+        return [info.filename for info in self.filelist]
+
+    def read(self, name):
+        entry = self.members[name]
+        return read_raw_member(os.path.join(self.folder, entry["shard"]), entry)
+
+    def close(self):
+        pass
+
+
+def open_year_archive(folder, year):
+    # the manually created <year>.zip if there is one, the downloaded shards otherwise
+    path = os.path.join(folder, f"{year}.zip")
+    if os.path.isfile(path):
+        return zipfile.ZipFile(path, "r")
+    if os.path.isfile(index_path(folder, year)):
+        return ShardReader(folder, year)
+    raise FileNotFoundError(f"neither {path} nor shards for {year} found in {folder}")
+
+
+_readers = {}
+
+
+def read_html_from_shards(html_path):
+    # resolves <folder>/<year>/<doi>.html against the shards in <folder>, returns None if the page is not stored there
+    html_path = os.path.normpath(str(html_path))
+    year_folder, filename = os.path.split(html_path)
+    folder, year = os.path.split(year_folder)
+    if not os.path.isfile(index_path(folder, year)):
+        return None
+    key = (folder, year)
+    if key not in _readers:
+        _readers[key] = ShardReader(folder, year)
+    name = f"{year}/{filename}"
+    if name not in _readers[key].members:
+        return None
+    return _readers[key].read(name)
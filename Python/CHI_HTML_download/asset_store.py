@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+# file containing the content addressed store for page resources (images, stylesheets, scripts)
+# every resource is stored once under the hash of its content, no matter how many papers reference it
+
+
+class AssetStore:
+    """Shared, hash keyed storage for page resources
+
+    Files are stored as <root>/<first two hash chars>/<sha256><ext>. The index maps each resource url to its stored
+    file, so a url is only downloaded once for the whole corpus.
+    """
+
+    def __init__(self, root="assets"):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(root, exist_ok=True)
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+        # urls which are currently being downloaded, so that concurrent pages share a single request
+        self.pending = {}
+
+    def save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _store(self, url, content):
+        digest = hashlib.sha256(content).hexdigest()
+        _, ext = os.path.splitext(os.path.basename(urlsplit(url).path))
+        ext = re.sub(r'\W+', '', ext)[:8]
+        relpath = os.path.join(digest[:2], digest + ("." + ext if ext else ""))
+        filepath = os.path.join(self.root, relpath)
+        if not os.path.isfile(filepath):  # identical content from another url is already stored
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            with open(filepath + ".tmp", 'wb') as file:
+                file.write(content)
+            os.replace(filepath + ".tmp", filepath)
+        self.index[url] = relpath
+        return filepath
+
+    async def _download(self, engine, url):
+        try:
+            response = await engine.fetch(url)
+            return self._store(url, response.content)
+        finally:
+            del self.pending[url]
+
+    async def get(self, engine, url):
+        # returns the path of the stored resource, downloading it only if the url was never seen before
+        if url in self.index:
+            return os.path.join(self.root, self.index[url])
+        if url not in self.pending:
+            self.pending[url] = asyncio.ensure_future(self._download(engine, url))
+        return await asyncio.shield(self.pending[url])
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import ACM_Lister
+import ACM_downloaderV2
+from manifest import DownloadManifest
+from replay import Cassette, ServerSettings, StandInServer
+
+# file benchmarking the downloader and the lister offline against the stand-in server of replay.py
+# usage: python benchmark.py <cassette folder> [configuration ...]
+# record a cassette first, e.g.: python replay.py record cassette ../../Data/Bibliography-Files/2023.csv 20
+
+# downloader configurations: name -> (download mode, text only)
+# "polite" is left out by default as it takes 5 seconds per request by design
+CONFIGURATIONS = {
+    "polite": ("polite", False),
+    "default": ("default", False),
+    "default text only": ("default", True),
+    "full_speed": ("full_speed", False),
+    "full_speed text only": ("full_speed", True),
+}
+DEFAULT_CONFIGURATIONS = ["default", "default text only", "full_speed", "full_speed text only"]
+
+# behaviour of the stand-in server
+SERVER_PROFILES = {
+    "ideal": ServerSettings(),
+    "slow network": ServerSettings(latency=0.1, latency_jitter=0.1, bandwidth=5_000_000),
+    "rate limited": ServerSettings(latency=0.02, error_rate=0.1, retry_after=0.5),
+}
+
+
+async def benchmark_downloader(cassette, server_settings, mode, text_only, urllist):
+    async with StandInServer(cassette, server_settings) as server:
+        local_urls = [server.local_url(url) for url in urllist]
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                ACM_downloaderV2.download_mode = mode
+                ACM_downloaderV2.text_only = text_only
+                ACM_downloaderV2.archive_folder = None
+                ACM_downloaderV2.asset_folder = "assets"
+                os.mkdir("bench")
+                manifest = DownloadManifest("manifest.sqlite")
+                start = time.perf_counter()
+                stats = await ACM_downloaderV2.parallell_download(local_urls, "bench", manifest)
+                seconds = time.perf_counter() - start
+                papers = len(manifest.completed("bench"))
+                manifest.close()
+            finally:
+                os.chdir(cwd)
+    return {
+        "papers": papers,
+        "seconds": round(seconds, 3),
+        "papers_per_second": round(papers / seconds, 3),
+        "bytes_per_second": round(stats["bytes"] / seconds),
+        "requests": stats["requests"],
+        "retries": stats["retries"],
+        "backoff_seconds": round(stats["backoff_seconds"], 3),
+        "failures": stats["failures"],
+        "injected_errors": server.stats["injected_errors"],
+    }
+
+
+async def benchmark_lister(cassette, server_settings):
+    async with StandInServer(cassette, server_settings) as server:
+        with tempfile.TemporaryDirectory() as cache_folder:
+            ACM_Lister.acm_base_url = server.base_url + "/dl.acm.org"
+            ACM_Lister.session_cache_folder = cache_folder
+            years = [year for year, doi in ACM_Lister.PROCEEDINGS.items()
+                     if "dl.acm.org/doi/proceedings/" + doi in cassette.index]
+            start = time.perf_counter()
+            session_dicts = await asyncio.to_thread(ACM_Lister.get_session_dicts, years)
+            seconds = time.perf_counter() - start
+    return {
+        "years": len(years),
+        "papers": sum(len(session_dict) for session_dict in session_dicts.values()),
+        "seconds": round(seconds, 3),
+        "bytes_per_second": round(server.stats["bytes"] / seconds) if seconds else 0,
+    }
+
+
+def run_benchmarks(cassette_folder, configurations):
+    cassette = Cassette(cassette_folder)
+    urllist = ["https://" + key for key in cassette.index if "/doi/fullHtml/" in key]
+    print(f"{len(urllist)} recorded papers, {len(cassette.index)} recorded responses")
+    results = {}
+    for profile, server_settings in SERVER_PROFILES.items():
+        results[profile] = {"lister": asyncio.run(benchmark_lister(cassette, server_settings))}
+        print(profile, "lister", results[profile]["lister"])
+        for name in configurations:
+            mode, text_only = CONFIGURATIONS[name]
+            results[profile][name] = asyncio.run(benchmark_downloader(cassette, server_settings, mode, text_only,
+                                                                      urllist))
+            print(profile, name, results[profile][name])
+    with open("benchmark_results.json", "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python benchmark.py <cassette folder> [configuration ...]")
+        print("configurations: " + ", ".join(CONFIGURATIONS))
+    else:
+        run_benchmarks(sys.argv[1], sys.argv[2:] or DEFAULT_CONFIGURATIONS)
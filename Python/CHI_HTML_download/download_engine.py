@@ -0,0 +1,242 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# file containing the asyncio download engine used by ACM_downloaderV2
+
+# status codes after which a request is retried, everything else that is not a success is given up on directly
+RETRY_STATUSES = {403, 408, 429, 500, 502, 503, 504}
+
+
+@dataclass(frozen=True)
+class DownloadSettings:
+    # maximum number of requests in flight at the same time
+    max_concurrency: int = 4
+    # token bucket per host: sustained requests per second and the allowed burst
+    requests_per_second: float = 1.0
+    burst: int = 2
+    # retries per url before giving up, backoff is exponential with jitter between base and max seconds
+    max_retries: int = 8
+    backoff_base: float = 2.0
+    backoff_max: float = 1800.0
+    # consecutive failures on one host before the circuit breaker opens, and how long it stays open
+    breaker_threshold: int = 5
+    breaker_cooldown: float = 1800.0
+    # after this many trips without a single success in between the whole crawl is aborted
+    breaker_max_trips: int = 4
+    timeout: float = 120.0
+
+
+# presets so that switching between crawling modes is one setting in ACM_downloaderV2
+DOWNLOAD_MODES = {
+    # behaves like the old downloader: one request at a time, long pauses once the server complains
+    "polite": DownloadSettings(max_concurrency=1, requests_per_second=0.2, burst=1),
+    "default": DownloadSettings(),
+    "full_speed": DownloadSettings(max_concurrency=32, requests_per_second=50.0, burst=50, backoff_max=300.0,
+                                   breaker_threshold=20, breaker_cooldown=300.0),
+}
+
+
+class DownloadError(Exception):
+    """Raised when a url could not be downloaded within the retry budget"""
+
+    def __init__(self, url, status=None, reason=""):
+        self.url = url
+        self.status = status
+        super().__init__(f"could not download {url} (status {status}) {reason}".strip())
+
+
+class CircuitOpenError(DownloadError):
+    """Raised when a host keeps failing after the circuit breaker tripped too often"""
+
+
+@dataclass
+class DownloadResult:
+    url: str
+    status: int
+    headers: dict
+    content: bytes
+    encoding: str = "utf-8"
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+
+class TokenBucket:
+    """Async token bucket limiting the request rate to a single host"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """Stops all requests to a host for a cooldown period after too many consecutive failures"""
+
+    def __init__(self, threshold, cooldown, max_trips):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_trips = max_trips
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+
+    async def wait_closed(self, host):
+        if self.trips > self.max_trips:
+            raise CircuitOpenError(host, reason=f"- circuit breaker tripped {self.trips} times in a row")
+        remaining = self.open_until - time.monotonic()
+        if remaining > 0:
+            print(f"circuit open for {host}, waiting {remaining / 60:.1f} mins")
+            await asyncio.sleep(remaining)
+
+    def record_success(self):
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self, host):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            self.failures = 0
+            self.trips += 1
+            self.open_until = time.monotonic() + self.cooldown
+
+
+def retry_after_seconds(headers):
+    # Retry-After can either be a number of seconds or a http date
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class DownloadEngine:
+    """Downloads urls concurrently while respecting per host rate limits
+
+    Usage:
+        async with DownloadEngine(DOWNLOAD_MODES["polite"]) as engine:
+            result = await engine.fetch(url)
+    """
+
+    def __init__(self, settings=DownloadSettings(), headers=None, recorder=None, telemetry=None):
+        self.settings = settings
+        self.headers = headers or {}
+        # optional replay.Cassette every successful response is recorded to
+        self.recorder = recorder
+        # optional telemetry.DownloadTelemetry measuring every request
+        self.telemetry = telemetry
+        self.semaphore = asyncio.Semaphore(settings.max_concurrency)
+        self.buckets = {}
+        self.breakers = {}
+        self.session = None
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "bytes": 0, "backoff_seconds": 0.0}
+
+    async def __aenter__(self):
+        # a single pooled session, so tcp/tls connections are kept alive and reused across all requests
+        connector = aiohttp.TCPConnector(limit=self.settings.max_concurrency, keepalive_timeout=60,
+                                         ttl_dns_cache=300)
+        trace_configs = [self.telemetry.trace_config()] if self.telemetry is not None else None
+        self.session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                             timeout=aiohttp.ClientTimeout(total=self.settings.timeout),
+                                             trace_configs=trace_configs)
+        if self.telemetry is not None:
+            self.telemetry.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        if self.telemetry is not None:
+            await self.telemetry.stop()
+
+    def _host_state(self, host):
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.settings.requests_per_second, self.settings.burst)
+            self.breakers[host] = CircuitBreaker(self.settings.breaker_threshold, self.settings.breaker_cooldown,
+                                                 self.settings.breaker_max_trips)
+        return self.buckets[host], self.breakers[host]
+
+    def _backoff(self, attempt, headers):
+        delay = retry_after_seconds(headers) if headers is not None else None
+        if delay is None:
+            # full jitter keeps concurrent workers from retrying in lockstep
+            delay = random.uniform(0, self.settings.backoff_base * 2 ** attempt)
+        return min(delay, self.settings.backoff_max)
+
+    def _failed(self):
+        self.stats["failures"] += 1
+        if self.telemetry is not None:
+            self.telemetry.observe_failure()
+
+    async def fetch(self, url, headers=None):
+        host = urlsplit(url).netloc
+        bucket, breaker = self._host_state(host)
+        status = None
+        for attempt in range(self.settings.max_retries + 1):
+            await breaker.wait_closed(host)
+            # filled by the telemetry trace hooks, the wait for the rate limit and a free slot is measured as well
+            timing = {"queued": time.perf_counter()} if self.telemetry is not None else None
+            await bucket.acquire()
+            response_headers = None
+            async with self.semaphore:
+                self.stats["requests"] += 1
+                try:
+                    async with self.session.get(url, headers=headers, trace_request_ctx=timing) as response:
+                        status = response.status
+                        response_headers = response.headers
+                        if status in (200, 304):
+                            content = await response.read()
+                            breaker.record_success()
+                            self.stats["bytes"] += len(content)
+                            if timing is not None:
+                                self.telemetry.observe_request(timing, status, len(content))
+                            result = DownloadResult(url, status, response.headers.copy(), content,
+                                                    response.get_encoding() if content else "utf-8")
+                            if self.recorder is not None and status == 200:
+                                self.recorder.record(result)
+                            return result
+                except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                    print(f"{url}: {exc!r}")
+                    status = None
+            if timing is not None:
+                self.telemetry.observe_request(timing, status if status is not None else "error")
+            if status is not None and status not in RETRY_STATUSES:
+                self._failed()
+                raise DownloadError(url, status)
+            print(f"{url}: status {status}")
+            breaker.record_failure(host)
+            if attempt == self.settings.max_retries:
+                break
+            delay = self._backoff(attempt, response_headers)
+            self.stats["retries"] += 1
+            self.stats["backoff_seconds"] += delay
+            if self.telemetry is not None:
+                self.telemetry.observe_retry(delay)
+            await asyncio.sleep(delay)
+        self._failed()
+        raise DownloadError(url, status, reason=f"- gave up after {self.settings.max_retries} retries")
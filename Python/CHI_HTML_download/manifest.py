@@ -0,0 +1,69 @@
+import sqlite3
+import time
+
+# file containing the persistent download manifest, it remembers which pages were downloaded and how they looked
+# so reruns can skip them and revalidate them with conditional requests
+
+
+class DownloadManifest:
+    """SQLite backed record of all downloaded pages, keyed by url"""
+
+    def __init__(self, path="download_manifest.sqlite"):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                doi TEXT NOT NULL,
+                year TEXT NOT NULL,
+                status TEXT NOT NULL,
+                size INTEGER,
+                sha256 TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                updated REAL NOT NULL
+            )""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS pages_year ON pages (year, status)")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def completed(self, year):
+        # set of urls that were downloaded successfully for this year, membership checks are O(1)
+        rows = self.connection.execute("SELECT url FROM pages WHERE year = ? AND status = 'done'", (str(year),))
+        return {row["url"] for row in rows}
+
+    def get(self, url):
+        return self.connection.execute("SELECT * FROM pages WHERE url = ?", (url,)).fetchone()
+
+    def conditional_headers(self, url):
+        # headers that let the server answer 304 Not Modified if the page did not change since the last download
+        entry = self.get(url)
+        headers = {}
+        if entry is not None and entry["status"] == "done":
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self, url, doi, year, status, size=None, sha256=None, etag=None, last_modified=None):
+        self.connection.execute("""
+            INSERT INTO pages (url, doi, year, status, size, sha256, etag, last_modified, updated)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (url) DO UPDATE SET
+                status = excluded.status,
+                size = COALESCE(excluded.size, size),
+                sha256 = COALESCE(excluded.sha256, sha256),
+                etag = COALESCE(excluded.etag, etag),
+                last_modified = COALESCE(excluded.last_modified, last_modified),
+                updated = excluded.updated""",
+                                (url, doi, str(year), status, size, sha256, etag, last_modified, time.time()))
+        self.connection.commit()
+
+    def touch(self, url):
+        # page was revalidated and did not change
+        self.connection.execute("UPDATE pages SET updated = ? WHERE url = ?", (time.time(), url))
+        self.connection.commit()
@@ -0,0 +1,212 @@
+import asyncio
+import csv
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from dataclasses import dataclass
+from urllib.parse import urljoin, urlsplit
+
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+from download_engine import DOWNLOAD_MODES, DownloadEngine, DownloadError
+
+# file containing the offline record/replay layer for the downloader and the lister
+# record:  python replay.py record <cassette folder> <bibliography csv> <number of papers>
+# serve:   python replay.py serve <cassette folder> [port]
+# the stand-in server answers like dl.acm.org with the recorded pages, see benchmark.py for the benchmarks on top of it
+
+# only these headers are recorded and replayed
+RECORDED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+def url_key(url):
+    # recordings are keyed by host, path and query, the scheme does not matter for the replay
+    parts = urlsplit(url)
+    return parts.netloc + parts.path + ("?" + parts.query if parts.query else "")
+
+
+class Cassette:
+    """Folder of recorded responses: index.json with status and headers per url, bodies stored by their sha256"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.index_path = os.path.join(folder, "index.json")
+        os.makedirs(os.path.join(folder, "bodies"), exist_ok=True)
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    @property
+    def hosts(self):
+        return sorted({key.split("/", 1)[0] for key in self.index})
+
+    def record(self, result):
+        digest = hashlib.sha256(result.content).hexdigest()
+        body_path = os.path.join(self.folder, "bodies", digest)
+        if not os.path.isfile(body_path):
+            with open(body_path, "wb") as f:
+                f.write(result.content)
+        self.index[url_key(result.url)] = {
+            "status": result.status,
+            "headers": {name: result.headers[name] for name in RECORDED_HEADERS if name in result.headers},
+            "body": digest,
+        }
+
+    def lookup(self, key):
+        entry = self.index.get(key)
+        if entry is None:
+            return None, None
+        with open(os.path.join(self.folder, "bodies", entry["body"]), "rb") as f:
+            return entry, f.read()
+
+    def save(self):
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+
+async def record(cassette, urllist, proceedings_urls=(), mode="polite"):
+    # fetches pages, their resources and the proceedings pages through the engine and records every response
+    async with DownloadEngine(DOWNLOAD_MODES[mode], headers={"User-Agent": "Chrome/121.0.6167.139"},
+                              recorder=cassette) as engine:
+        for url in list(proceedings_urls) + list(urllist):
+            try:
+                response = await engine.fetch(url)
+            except DownloadError as e:
+                # one bad link must not end the recording
+                print(e, file=sys.stderr)
+                continue
+            if url in proceedings_urls:
+                continue
+            soup = BeautifulSoup(response.text, "html.parser")
+            resources = {urljoin(url, res[inner]) for tag, inner in {'img': 'src', 'link': 'href',
+                                                                      'script': 'src'}.items()
+                         for res in soup.findAll(tag) if res.has_attr(inner)}
+            results = await asyncio.gather(*(engine.fetch(resource) for resource in resources
+                                             if url_key(resource) not in cassette.index), return_exceptions=True)
+            for exc in results:
+                if isinstance(exc, Exception):
+                    print(exc, file=sys.stderr)
+    cassette.save()
+
+
+@dataclass(frozen=True)
+class ServerSettings:
+    # delay before every response, plus a random jitter of up to latency_jitter seconds
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    # share of requests answered with one of error_statuses instead of the recorded page
+    error_rate: float = 0.0
+    error_statuses: tuple = (429, 503)
+    # Retry-After sent with the injected errors, None to send none
+    retry_after: float | None = 1.0
+    # bytes per second for all responses together, None for no limit
+    bandwidth: float | None = None
+
+
+class StandInServer:
+    """Local http server replaying a cassette like dl.acm.org would, with optional latency, errors and bandwidth cap
+
+    Recorded urls are served at /<host>/<path>. Absolute links to recorded hosts in the replayed pages are rewritten
+    to the stand-in, paths without a known host are served from the first recorded host (dl.acm.org).
+    """
+
+    def __init__(self, cassette, settings=ServerSettings(), host="127.0.0.1", port=0):
+        self.cassette = cassette
+        self.settings = settings
+        self.host = host
+        self.port = port
+        self.hosts = cassette.hosts
+        self.default_host = "dl.acm.org" if "dl.acm.org" in self.hosts else (self.hosts or [""])[0]
+        self.host_links = re.compile(r"(?:https?:)?//(" + "|".join(re.escape(h) for h in self.hosts) + r")/") \
+            if self.hosts else None
+        self.runner = None
+        self.bandwidth_free_at = 0.0
+        self.stats = {"requests": 0, "injected_errors": 0, "not_found": 0, "bytes": 0}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def local_url(self, url):
+        return f"{self.base_url}/{url_key(url)}"
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]  # the actual port if 0 was requested
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.runner.cleanup()
+
+    async def _throttle(self, nbytes):
+        # shared bandwidth: every response reserves its transfer time on one timeline
+        if not self.settings.bandwidth:
+            return
+        now = time.monotonic()
+        start = max(now, self.bandwidth_free_at)
+        self.bandwidth_free_at = start + nbytes / self.settings.bandwidth
+        await asyncio.sleep(self.bandwidth_free_at - now)
+
+    async def handle(self, request):
+        self.stats["requests"] += 1
+        settings = self.settings
+        if settings.latency or settings.latency_jitter:
+            await asyncio.sleep(settings.latency + random.uniform(0, settings.latency_jitter))
+        if settings.error_rate and random.random() < settings.error_rate:
+            self.stats["injected_errors"] += 1
+            headers = {"Retry-After": str(settings.retry_after)} if settings.retry_after is not None else {}
+            return web.Response(status=random.choice(settings.error_statuses), headers=headers)
+        path = request.raw_path.lstrip("/")
+        if path.split("/", 1)[0] not in self.hosts:
+            path = self.default_host + "/" + path
+        entry, body = self.cassette.lookup(path)
+        if entry is None:
+            self.stats["not_found"] += 1
+            return web.Response(status=404)
+        headers = dict(entry["headers"])
+        if "ETag" in headers and request.headers.get("If-None-Match") == headers["ETag"]:
+            return web.Response(status=304, headers=headers)
+        if self.host_links is not None and headers.get("Content-Type", "").startswith("text/html"):
+            body = self.host_links.sub(lambda m: f"{self.base_url}/{m.group(1)}/", body.decode("utf-8", "replace"))
+            body = body.encode("utf-8")
+        await self._throttle(len(body))
+        self.stats["bytes"] += len(body)
+        return web.Response(status=entry["status"], body=body, headers=headers)
+
+
+async def serve_forever(cassette, port):
+    async with StandInServer(cassette, port=port) as server:
+        print(f"serving {len(cassette.index)} recorded responses on {server.base_url}")
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 5 and sys.argv[1] == "record":
+        from ACM_Lister import PROCEEDINGS, acm_base_url
+
+        with open(sys.argv[3], "r", encoding="UTF-8", newline="") as csvfile:
+            reader = csv.reader(csvfile, delimiter=";")
+            # skip the header, titles can contain quoted ; and line breaks
+            next(reader, None)
+            links = [row[1] for row in itertools.islice(reader, int(sys.argv[4]))]
+        proceedings = [acm_base_url + "/doi/proceedings/" + doi for doi in PROCEEDINGS.values()]
+        asyncio.run(record(Cassette(sys.argv[2]), links, proceedings))
+    elif len(sys.argv) >= 3 and sys.argv[1] == "serve":
+        asyncio.run(serve_forever(Cassette(sys.argv[2]), int(sys.argv[3]) if len(sys.argv) > 3 else 8080))
+    else:
+        print("Usage: python replay.py record <cassette folder> <bibliography csv> <number of papers>\n"
+              "       python replay.py serve <cassette folder> [port]")
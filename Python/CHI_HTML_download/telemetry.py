@@ -0,0 +1,175 @@
+import asyncio
+import json
+import os
+import time
+from bisect import bisect_left
+
+import aiohttp
+
+# file containing the request instrumentation of the download engine
+# per request the wait for the rate limiter and a free concurrency slot, the dns, connect, time to first byte and
+# total latency, bytes, retries and backoff time are aggregated into histograms, which are periodically written as
+# json and in the prometheus text format
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 10_000_000)
+BACKOFF_BUCKETS = (0.1, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 1800.0)
+
+
+class Histogram:
+    """Fixed bucket histogram, the buckets are upper bounds like in prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # upper bound of the bucket the quantile falls into
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {"buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)), "sum": self.sum,
+                "count": self.count, "p50": self.quantile(0.5), "p95": self.quantile(0.95)}
+
+    def to_prometheus(self, name):
+        lines = [f"# TYPE {name} histogram"]
+        cumulative = 0
+        for bound, count in zip([str(b) for b in self.buckets] + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum {self.sum}")
+        lines.append(f"{name}_count {self.count}")
+        return lines
+
+
+class DownloadTelemetry:
+    """Collects the measurements of one download engine and exports them every interval seconds"""
+
+    def __init__(self, folder="telemetry", interval=10.0):
+        self.folder = folder
+        self.interval = interval
+        self.started = time.time()
+        self.histograms = {
+            # high wait times: our own rate limit or concurrency is the bottleneck
+            "wait_seconds": Histogram(LATENCY_BUCKETS),
+            "dns_seconds": Histogram(LATENCY_BUCKETS),
+            "connect_seconds": Histogram(LATENCY_BUCKETS),
+            "ttfb_seconds": Histogram(LATENCY_BUCKETS),
+            "total_seconds": Histogram(LATENCY_BUCKETS),
+            "response_bytes": Histogram(SIZE_BUCKETS),
+            "backoff_seconds": Histogram(BACKOFF_BUCKETS),
+        }
+        self.statuses = {}
+        self.counters = {"requests": 0, "bytes": 0, "retries": 0, "failures": 0, "reused_connections": 0}
+        self.export_task = None
+
+    def trace_config(self):
+        # aiohttp calls these hooks for every request, the timings are collected in the trace_request_ctx dict
+        # the engine passes to session.get
+        trace_config = aiohttp.TraceConfig()
+
+        def hook(key):
+            async def on_event(session, context, params):
+                if context.trace_request_ctx is not None:
+                    context.trace_request_ctx[key] = time.perf_counter()
+            return on_event
+
+        async def on_reuse(session, context, params):
+            self.counters["reused_connections"] += 1
+
+        trace_config.on_request_start.append(hook("start"))
+        trace_config.on_dns_resolvehost_start.append(hook("dns_start"))
+        trace_config.on_dns_resolvehost_end.append(hook("dns_end"))
+        trace_config.on_connection_create_start.append(hook("connect_start"))
+        trace_config.on_connection_create_end.append(hook("connect_end"))
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_request_end.append(hook("headers"))  # response headers arrived
+        return trace_config
+
+    def observe_request(self, timing, status, nbytes=0):
+        end = time.perf_counter()
+        self.counters["requests"] += 1
+        self.counters["bytes"] += nbytes
+        self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+        if "dns_end" in timing and "dns_start" in timing:
+            self.histograms["dns_seconds"].observe(timing["dns_end"] - timing["dns_start"])
+        if "connect_end" in timing and "connect_start" in timing:
+            self.histograms["connect_seconds"].observe(timing["connect_end"] - timing["connect_start"])
+        if "start" in timing:
+            if "queued" in timing:
+                self.histograms["wait_seconds"].observe(timing["start"] - timing["queued"])
+            if "headers" in timing:
+                self.histograms["ttfb_seconds"].observe(timing["headers"] - timing["start"])
+            self.histograms["total_seconds"].observe(end - timing["start"])
+        if nbytes:
+            self.histograms["response_bytes"].observe(nbytes)
+
+    def observe_retry(self, backoff):
+        self.counters["retries"] += 1
+        self.histograms["backoff_seconds"].observe(backoff)
+
+    def observe_failure(self):
+        self.counters["failures"] += 1
+
+    def to_dict(self):
+        elapsed = time.time() - self.started
+        return {
+            "elapsed_seconds": elapsed,
+            "requests_per_second": self.counters["requests"] / elapsed if elapsed else 0.0,
+            "bytes_per_second": self.counters["bytes"] / elapsed if elapsed else 0.0,
+            "counters": self.counters,
+            "statuses": self.statuses,
+            "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for name, value in self.counters.items():
+            lines += [f"# TYPE acm_download_{name}_total counter", f"acm_download_{name}_total {value}"]
+        lines.append("# TYPE acm_download_responses_total counter")
+        for status, value in sorted(self.statuses.items()):
+            lines.append(f'acm_download_responses_total{{status="{status}"}} {value}')
+        for name, histogram in self.histograms.items():
+            lines += histogram.to_prometheus(f"acm_download_{name}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        os.makedirs(self.folder, exist_ok=True)
+        for filename, content in (("download_telemetry.json", json.dumps(self.to_dict(), indent=2)),
+                                  ("download_telemetry.prom", self.to_prometheus())):
+            path = os.path.join(self.folder, filename)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+
+    async def export_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.export()
+
+    def start(self):
+        self.export_task = asyncio.ensure_future(self.export_periodically())
+
+    async def stop(self):
+        if self.export_task is not None:
+            self.export_task.cancel()
+            try:
+                await self.export_task
+            except asyncio.CancelledError:
+                pass
+        self.export()
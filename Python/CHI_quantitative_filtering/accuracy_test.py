@@ -4,29 +4,35 @@ import csv
 def compare_csv_rows(file1, file2):
     with open(file1, 'r') as csvfile1, open(file2, 'r') as csvfile2:
         reader1 = csv.DictReader(csvfile1, delimiter=';')
-        reader2 = csv.DictReader(csvfile2, delimiter=';')
+        # filter results indexed by paper, the two files do not need to have the same order
+        results = {row['Paper']: row for row in csv.DictReader(csvfile2, delimiter=';')}
         counter = 0
         true_counter = 0
-        for row1, row2 in zip(reader1, reader2):
+        missing = 0
+        for row1 in reader1:
+            if not row1['Paper']:
+                continue
+            if row1['Paper'] not in results:
+                missing += 1
+                continue
             ground_truth = row1['Ground Truth']
-            one_true = row2['one_true']
+            one_true = results[row1['Paper']]['one_true']
 
             # Convert values to bool for comparison
             ground_truth_bool = True if ground_truth == 'T' else False
             one_true_bool = True if one_true == 'True' else False
 
             if ground_truth_bool == one_true_bool:
-                print(f"Row {reader1.line_num}: Match")
                 true_counter += 1
             else:
-                print(f"Row {reader1.line_num}: Mismatch")
+                print(f"Row {reader1.line_num}: Mismatch ({row1['Paper']})")
             counter += 1
-        print("Accuracy:", true_counter / counter)
+        print("Accuracy:", true_counter / counter, f"(ground truth papers missing in the results: {missing})")
     return true_counter / counter
 
 
-# this only works if the papers listed in the sample CSV are exactly the same papers as in the sample_gt and in the same order
-# see our files in Data/list_of_gt_CHI_papers
+# the papers are matched by name, papers of the sample_gt that are not in the sample CSV are left out and counted
+# see our files in Data/list_of_gt_CHI_papers, filter_benchmark.py also computes precision, recall and f1 per filter
 years = [2019, 2020, 2021, 2022, 2023]
 total = 0
 for year in years:
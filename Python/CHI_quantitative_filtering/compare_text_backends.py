@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+from filter_scanner import MultiPatternScanner
+from text_extraction import TEXT_BACKENDS
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CHI_HTML_download"))
+from archive_shards import open_year_archive  # noqa: E402
+
+# file checking the text backends against the original BeautifulSoup text and timing them on the papers of a year
+# usage: python compare_text_backends.py <folder with the zip archives> <year> [backend ...]
+# a backend is equivalent if its text is identical to the bs4 text, for the others the filter results are compared
+
+
+def compare_backends(folder, year, backends):
+    archive = open_year_archive(folder, str(year))
+    papers = [file.filename for file in archive.filelist if file.filename.endswith(".html")]
+    scanner = MultiPatternScanner()
+    seconds = {backend: 0.0 for backend in ["bs4"] + backends}
+    different_text = {backend: [] for backend in backends}
+    different_flags = {backend: [] for backend in backends}
+    for paper in papers:
+        html = archive.read(paper)
+        start = time.perf_counter()
+        expected = TEXT_BACKENDS["bs4"](html)
+        seconds["bs4"] += time.perf_counter() - start
+        expected_flags = scanner.scan(expected).flags
+        for backend in backends:
+            start = time.perf_counter()
+            text = TEXT_BACKENDS[backend](html)
+            seconds[backend] += time.perf_counter() - start
+            if text != expected:
+                different_text[backend].append(paper)
+                if scanner.scan(text).flags != expected_flags:
+                    different_flags[backend].append(paper)
+    print(f"{year}: {len(papers)} papers")
+    for backend, total in seconds.items():
+        line = f"{backend:>8}: {total:8.2f}s, {total / max(len(papers), 1) * 1000:7.1f}ms per paper, " \
+               f"{seconds['bs4'] / total if total else 0:5.1f}x"
+        if backend != "bs4":
+            line += f", different text: {len(different_text[backend])}, " \
+                    f"different filter results: {len(different_flags[backend])}"
+        print(line)
+    for backend in backends:
+        for paper in different_flags[backend]:
+            print(f"{backend} changes the filter results of {paper}")
+    return seconds, different_text, different_flags
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python compare_text_backends.py <folder with the zip archives> <year> [backend ...]")
+        print("backends: " + ", ".join(TEXT_BACKENDS))
+    else:
+        compare_backends(sys.argv[1], sys.argv[2], sys.argv[3:] or [b for b in TEXT_BACKENDS if b != "bs4"])
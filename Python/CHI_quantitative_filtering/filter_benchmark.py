@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+
+import pandas as pd
+
+from filter_scanner import MultiPatternScanner
+from text_extraction import TEXT_BACKENDS, iter_text_chunks
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CHI_HTML_download"))
+from archive_shards import open_year_archive  # noqa: E402
+
+# file scoring the quantitative filters against the manually checked papers in Data/list_of_gt_CHI_papers
+# usage: python filter_benchmark.py <ground truth folder> [folder with the zip archives]
+# without the zip folder the <year>_sample.csv files in the ground truth folder are scored, with it every text backend
+# and the full and the fast triage filtering are timed and scored on the ground truth papers
+
+YEARS = [2019, 2020, 2021, 2022, 2023]
+# filter results that are scored, the csv columns of quantitative_filtering.py
+FILTER_COLUMNS = {"p_filter": "p_val", "p_val_filter": "p - val_str", "ci_filter": "CI", "bayesian_filter": "bayes"}
+
+
+def read_year_csvs(folder, suffix, years=YEARS):
+    frames = []
+    for year in years:
+        frame = pd.read_csv(os.path.join(folder, f"{year}{suffix}"), sep=";", dtype=str).dropna(subset=["Paper"])
+        frames.append(frame.assign(Year=year))
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_ground_truth(folder, years=YEARS):
+    ground_truth = read_year_csvs(folder, "_sample_gt.csv", years)
+    ground_truth["Ground Truth"] = ground_truth["Ground Truth"].str.strip() == "T"
+    return ground_truth[["Year", "Paper", "Ground Truth"]].drop_duplicates(["Year", "Paper"])
+
+
+def score(ground_truth, results, columns):
+    # joins the results with the ground truth on the paper and computes precision, recall and f1 of every column
+    # per year and over all years, papers without a result or without a ground truth are left out
+    joined = ground_truth.merge(results, on=["Year", "Paper"], how="inner", validate="one_to_one")
+    truth = joined["Ground Truth"].to_numpy()
+    predictions = joined[columns].apply(lambda column: column.astype(str).str.strip() == "True")
+    counts = pd.concat({
+        "tp": predictions & truth[:, None],
+        "fp": predictions & ~truth[:, None],
+        "fn": ~predictions & truth[:, None],
+        "tn": ~predictions & ~truth[:, None],
+    }, axis=1)
+    per_year = counts.groupby(joined["Year"]).sum()
+    per_year.loc["all"] = per_year.sum()
+    per_year = per_year.stack(level=1, future_stack=True)
+    per_year.index.names = ["Year", "Filter"]
+    per_year["precision"] = per_year["tp"] / (per_year["tp"] + per_year["fp"])
+    per_year["recall"] = per_year["tp"] / (per_year["tp"] + per_year["fn"])
+    per_year["f1"] = 2 * per_year["tp"] / (2 * per_year["tp"] + per_year["fp"] + per_year["fn"])
+    per_year["accuracy"] = (per_year["tp"] + per_year["tn"]) / per_year[["tp", "fp", "fn", "tn"]].sum(axis=1)
+    return per_year.fillna(0.0)
+
+
+def score_sample_csvs(folder, years=YEARS):
+    ground_truth = load_ground_truth(folder, years)
+    results = read_year_csvs(folder, "_sample.csv", years)
+    columns = ["one_true"] + [column for column in FILTER_COLUMNS.values() if column in results]
+    return score(ground_truth, results, columns)
+
+
+def run_filters(archive, papers, backend, fast):
+    # filter results of the papers as in quantitative_analysis, either with all filters on the full text or only
+    # one_true with the early exit of the fast triage
+    scanner = MultiPatternScanner(list(FILTER_COLUMNS))
+    rows = []
+    for paper in papers:
+        html = archive.read(paper)
+        if fast:
+            rows.append({"Paper": paper, "one_true": scanner.first_match(iter_text_chunks(html)) is not None})
+            continue
+        flags = scanner.scan(TEXT_BACKENDS[backend](html)).flags
+        rows.append({"Paper": paper, "one_true": any(flags.values()),
+                     **{FILTER_COLUMNS[name]: flag for name, flag in flags.items()}})
+    return pd.DataFrame(rows, columns=["Paper", "one_true"] + ([] if fast else list(FILTER_COLUMNS.values())))
+
+
+def benchmark_engines(ground_truth_folder, zip_folder, years=YEARS):
+    ground_truth = load_ground_truth(ground_truth_folder, years)
+    engines = [(backend, False) for backend in TEXT_BACKENDS] + [("stream", True)]
+    summary = []
+    for backend, fast in engines:
+        name = backend + (" fast triage" if fast else "")
+        seconds = 0.0
+        results = []
+        try:
+            for year in years:
+                archive = open_year_archive(zip_folder, str(year))
+                papers = [paper for paper in ground_truth.loc[ground_truth["Year"] == year, "Paper"]
+                          if paper in archive.namelist()]
+                start = time.perf_counter()
+                results.append(run_filters(archive, papers, backend, fast).assign(Year=year))
+                seconds += time.perf_counter() - start
+        except ImportError as e:
+            print(f"{name}: skipped ({e})")
+            continue
+        results = pd.concat(results, ignore_index=True)
+        scores = score(ground_truth, results, ["one_true"] + ([] if fast else list(FILTER_COLUMNS.values())))
+        print(f"\n{name}: {seconds:.2f}s for {len(results)} papers")
+        print(scores.round(3).to_string())
+        overall = scores.loc[("all", "one_true")]
+        summary.append({"engine": name, "seconds": round(seconds, 3), "papers": len(results),
+                        **overall[["precision", "recall", "f1"]].round(3).to_dict()})
+    summary = pd.DataFrame(summary)
+    print("\n" + summary.to_string(index=False))
+    return summary
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python filter_benchmark.py <ground truth folder> [folder with the zip archives]")
+    elif len(sys.argv) == 2:
+        print(score_sample_csvs(sys.argv[1]).round(3).to_string())
+    else:
+        benchmark_engines(sys.argv[1], sys.argv[2])
@@ -1,14 +1,41 @@
+import concurrent.futures
 import csv
+import json
+import os
 import random
-import re
-import zipfile
+import sys
 
-from bs4 import BeautifulSoup
+# the per-year shards written by the downloader are read directly, without zipping the html files first
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CHI_HTML_download"))
+from archive_shards import open_year_archive  # noqa: E402
+from filter_scanner import FILTERS, MultiPatternScanner  # noqa: E402
+from text_extraction import TEXT_BACKENDS, iter_text_chunks  # noqa: E402
 
 # Set the random seed to keep same sample after execution - was chosen at random from 1 - 10_000_000
 random.seed(7_038_360)
 # amount of papers we want to sample, choose -1 to select all
 sample_size = -1
+# csv column per filter, the filters are defined in filter_scanner.py (e.g. add "es_filter": "effect size")
+filter_columns = {"p_filter": "p_val", "p_val_filter": "p - val_str", "ci_filter": "CI", "bayesian_filter": "bayes"}
+# html to text backend, see text_extraction.py: "stream" gives the same text as "bs4" (the original) but is faster,
+# "lxml" is the fastest but needs lxml installed
+text_backend = "stream"
+# worker processes for the papers, 1 runs everything in this process
+workers = os.cpu_count() or 1
+# papers per work unit sent to a worker
+chunk_size = 8
+# only filter papers that are new or changed in the archive and filters that are new or changed since the last run,
+# the results are kept in <year>_filter_state.json next to the csv (delete it to filter everything again)
+incremental = True
+# additionally write the number of matches per filter and the statistics density (matches per 10,000 characters of
+# text) of every paper, the extraction with the powerpaperparser can then start with the densest papers
+triage = False
+# only decide one_true: the html is parsed in chunks and parsing and filtering stop at the first match of any filter,
+# the csv then only has the Paper and one_true columns (always uses the "stream" text backend, not incremental)
+fast_triage = False
+
+# archive handle and text backend of a worker process, set by init_worker
+worker_state = {}
 
 
 def choose_sample(archive, paper_sample_size):
@@ -28,61 +55,136 @@ def write_csv(filename, headers, data):
             writer.writerow(row)
 
 
-def get_html_text_noref(html):
-    soup = BeautifulSoup(html, 'html.parser')
-
-    # Find all elements with class 'bibUl' (References) and remove them
-    for element in soup.find_all(class_='bibUl'):
-        element.decompose()
-    text_content = soup.get_text()
-    return text_content
+def get_html_text_noref(html, backend=None):
+    # text of the paper without the references (elements with class 'bibUl')
+    return TEXT_BACKENDS[backend or text_backend](html)
 
 
 def quantitative_filter(html_string, filter_type="p_filter", detail=False):
-    match filter_type:
-        case "p_filter":
-            # find any occurrence of p reporting
-            pattern = r"[\(\s]\s*p(\s+[a-zA-Z-]{0,12})?\s*[=<>]"
-            match = re.search(pattern, html_string)
-        case "p_val_filter":
-            # find any occurrence of p-val wording
-            pattern = r"\sp\s*-?\s*val"
-            match = re.search(pattern, html_string)
-        case "bayesian_filter":
-            # find any occurrence of bayes factor wording
-            pattern = r'bayes\s*factor'
-            match = re.search(pattern, html_string, re.IGNORECASE)
-        case "ci_filter":
-            # find any occurrence of confidence interval wording
-            pattern = r"confidence\s*interval"
-            match = re.search(pattern, html_string, re.IGNORECASE)
-        case _:
-            print("filter not found")
-            return
+    # single filter, quantitative_analysis runs all filters at once with a MultiPatternScanner
+    if filter_type not in FILTERS:
+        print("filter not found")
+        return
+    match = FILTERS[filter_type].regex.search(html_string)
     if detail:
         return match
     return bool(match)
 
 
+def filter_version(name, backend, counts=False):
+    # the results of a filter depend on its pattern and on the text the backend extracted, results without the number
+    # of matches (only found or not, without triage) cannot be used for the counts
+    return FILTERS[name].version + ":" + backend + (":counts" if counts else "")
+
+
+def load_filter_state(filename):
+    # per paper: crc and size of the archive member, length of its text and {filter: [version, number of matches]}
+    # (1 or 0 for found or not if the matches were not counted)
+    if not incremental or not os.path.isfile(filename):
+        return {}
+    with open(filename, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_filter_state(filename, state):
+    if not incremental:
+        return
+    with open(filename + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(filename + ".tmp", filename)
+
+
+def init_worker(folder, year, backend):
+    # every worker opens its own handle of the archive once, the settings are passed as they are not inherited
+    # by spawned processes
+    worker_state["archive"] = open_year_archive(folder, year)
+    worker_state["backend"] = backend
+
+
+def filter_paper(task):
+    # task: (paper, names of the filters to run, count the matches or only search for the first one)
+    paper, names, counts = task
+    html = worker_state["archive"].read(paper)
+    text_content = get_html_text_noref(html, worker_state["backend"])
+    result = MultiPatternScanner(names).scan(text_content, counts=counts)
+    if counts:
+        return paper, result.counts, len(text_content)
+    return paper, {name: int(flag) for name, flag in result.flags.items()}, len(text_content)
+
+
+def fast_filter_paper(task):
+    # task: (paper, names of the filters to run)
+    paper, names = task
+    html = worker_state["archive"].read(paper)
+    return paper, MultiPatternScanner(names).first_match(iter_text_chunks(html)) is not None
+
+
+def run_tasks(function, tasks, worker_args):
+    if workers > 1 and len(tasks) > 1:
+        # map returns the results in the order of the tasks, however the chunks are distributed
+        with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+                                                    initargs=worker_args) as executor:
+            return list(executor.map(function, tasks, chunksize=chunk_size))
+    init_worker(*worker_args)
+    return [function(task) for task in tasks]
+
+
+def statistics_density(counts, text_length):
+    # matches of all filters per 10,000 characters, papers that only mention a p-value or a confidence interval in
+    # passing get a low score
+    return round(10_000 * sum(counts) / text_length, 3) if text_length else 0.0
+
+
 def quantitative_analysis(zipfile_name, folder):
     # headers defined by the filters
-    headers = ['Paper', "one_true", 'p_val', "p - val_str", "CI", "bayes"]
-    path = folder + "/" + str(zipfile_name)
-    archive = zipfile.ZipFile(path, 'r')
+    headers = ['Paper', "one_true"] + list(filter_columns.values())
+    if triage:
+        headers += [column + " count" for column in filter_columns.values()] + ["density"]
+    year = str(zipfile_name)[:-4]
+    # <year>.zip if it exists, otherwise the shards <year>-000.zip, ... written by the downloader
+    archive = open_year_archive(folder, year)
+    # the sample is always chosen here, so the seeded order does not depend on the number of workers
     n = (choose_sample(archive, sample_size))
     print(zipfile_name)
+    if fast_triage:
+        filtered_paper_list = run_tasks(fast_filter_paper, [(paper, list(filter_columns)) for paper in n],
+                                        (folder, year, "stream"))
+        print("quant percentage: ", sum(int(one_true) for _, one_true in filtered_paper_list) / len(n))
+        write_csv(year + "_sample.csv", ['Paper', "one_true"], filtered_paper_list)
+        return
+    state_file = year + "_filter_state.json"
+    state = load_filter_state(state_file)
+    # the matches are only counted for the triage columns, counted results also give the flags
+    versions = {name: filter_version(name, text_backend, counts=triage) for name in filter_columns}
+    usable = {name: {versions[name], filter_version(name, text_backend, counts=True)} for name in filter_columns}
+    infos = {info.filename: info for info in archive.infolist()}
+    tasks = []
+    for paper in n:
+        entry = state.get(paper)
+        if entry is None or entry["crc"] != infos[paper].CRC or entry["size"] != infos[paper].file_size \
+                or "length" not in entry:
+            # new or changed paper (or a state file without text lengths)
+            entry = state[paper] = {"crc": infos[paper].CRC, "size": infos[paper].file_size, "results": {}}
+        missing = [name for name in filter_columns if entry["results"].get(name, [None])[0] not in usable[name]]
+        if missing:
+            tasks.append((paper, missing, triage))
+    print(f"filtering {len(tasks)} of {len(n)} papers")
+    # the results are merged by paper, the rows keep the order of the sample
+    results = run_tasks(filter_paper, tasks, (folder, year, text_backend))
+    for paper, counts, text_length in results:
+        state[paper]["results"].update({name: [versions[name], count] for name, count in counts.items()})
+        state[paper]["length"] = text_length
+    # papers that are no longer in the archive are dropped
+    save_filter_state(state_file, {paper: entry for paper, entry in state.items() if paper in infos})
     filtered_paper_list = []
-    percentage = 0
     for paper in n:
-        html = archive.read(paper)
-        text_content = get_html_text_noref(html)
-        ci = quantitative_filter(text_content, "ci_filter")
-        p = quantitative_filter(text_content, "p_filter")
-        p_val = quantitative_filter(text_content, "p_val_filter")
-        bayes = quantitative_filter(text_content, "bayesian_filter")
-        one_true = ci or p or p_val or bayes
-        percentage += int(one_true)
-        filtered_paper_list.append((paper, one_true, p, p_val, ci, bayes))
+        counts = [state[paper]["results"][name][1] for name in filter_columns]
+        flags = [count > 0 for count in counts]
+        row = (paper, any(flags), *flags)
+        if triage:
+            row += (*counts, statistics_density(counts, state[paper]["length"]))
+        filtered_paper_list.append(row)
+    percentage = sum(int(row[1]) for row in filtered_paper_list)
     print("quant percentage: ", percentage / len(n))
 
     write_csv(str(zipfile_name[:-4]) + "_sample.csv", headers, filtered_paper_list)
@@ -90,6 +192,8 @@ def quantitative_analysis(zipfile_name, folder):
 
 # Path to the directory containing the zip archives with the html papers
 html_zip_folder = r"CHI_HTML_download\html_paper_zip"
-# run the quantitative analysis on all years
-for zip_file in ["2019.zip", "2020.zip", "2021.zip", "2022.zip", "2023.zip"]:
-    quantitative_analysis(zip_file, html_zip_folder)
+
+if __name__ == "__main__":
+    # run the quantitative analysis on all years
+    for zip_file in ["2019.zip", "2020.zip", "2021.zip", "2022.zip", "2023.zip"]:
+        quantitative_analysis(zip_file, html_zip_folder)
@@ -0,0 +1,200 @@
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.dammit import EntitySubstitution
+
+# file containing the backends that turn a paper's html into its text without the reference list (class 'bibUl')
+#   bs4:    the original BeautifulSoup tree, slowest
+#   stream: event based html.parser, drops the reference list while parsing without building a tree,
+#           gives exactly the same text as bs4
+#   lxml:   libxml2 parser, fastest, the whitespace can differ slightly from bs4 (needs lxml installed)
+# compare_text_backends.py checks the equivalence and benchmarks the backends on the papers of a year
+
+REFERENCE_CLASS = "bibUl"
+# the text inside these elements is not returned by BeautifulSoup's get_text()
+SKIPPED_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+# elements without a closing tag, the same list as BeautifulSoup's html tree builder
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta", "param",
+             "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex", "nextid",
+             "spacer"}
+# whitespace only strings in these elements are kept as they are
+PRESERVE_WHITESPACE_TAGS = {"pre", "textarea"}
+ASCII_SPACES = str.maketrans("", "", "\x20\x0a\x09\x0c\x0d")
+
+
+def decode_html(html):
+    # the zip archives return bytes, decoded the same way as BeautifulSoup does (the declared <meta charset> first)
+    if isinstance(html, str):
+        return html
+    return UnicodeDammit(html, is_html=True).unicode_markup or ""
+
+
+def bs4_text(html):
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # Find all elements with class 'bibUl' (References) and remove them
+    for element in soup.find_all(class_=REFERENCE_CLASS):
+        element.decompose()
+    return soup.get_text()
+
+
+class StreamTextExtractor(HTMLParser):
+    """Collects the text of an html document like BeautifulSoup's get_text() after removing the reference list
+
+    Follows the tree building rules of BeautifulSoup's html.parser builder (an end tag closes the most recent open
+    element with that name, void elements close immediately, whitespace only strings collapse to one space or newline)
+    but only keeps a stack of the open tag names. The document can be fed in chunks, take_text() returns the text
+    collected so far.
+    """
+
+    def __init__(self):
+        # entities are resolved like in BeautifulSoup, which also turns off convert_charrefs
+        super().__init__(convert_charrefs=False)
+        # open elements: (tag name, is reference list, skips text, preserves whitespace)
+        self.stack = []
+        self.in_references = 0
+        self.in_skipped = 0
+        self.in_preserved = 0
+        self.already_closed_void = []
+        self.current = []
+        self.text = []
+
+    def end_data(self, cdata=False):
+        # one string of the tree ends here
+        if not self.current:
+            return
+        data = "".join(self.current)
+        self.current = []
+        # CDATA sections are kept in script, style, ... elements
+        if self.in_references or (self.in_skipped and not cdata):
+            return
+        if not self.in_preserved and not data.translate(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        self.text.append(data)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):
+        self.end_data()
+        is_reference = any(name == "class" and value and REFERENCE_CLASS in value.split() for name, value in attrs)
+        element = (tag, is_reference, tag in SKIPPED_TEXT_TAGS, tag in PRESERVE_WHITESPACE_TAGS)
+        self.stack.append(element)
+        self._count(element, 1)
+        if tag in VOID_TAGS and handle_empty_element:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/> opens and closes the element
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag, check_already_closed=True):
+        if check_already_closed and tag in self.already_closed_void:
+            # the end tag of a void element that was already closed, BeautifulSoup ignores it without ending the string
+            # (and a following <tag/> stays open)
+            self.already_closed_void.remove(tag)
+            return
+        self.end_data()
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                for element in self.stack[i:]:
+                    self._count(element, -1)
+                del self.stack[i:]
+                break
+
+    def _count(self, element, step):
+        _, is_reference, skips_text, preserves_whitespace = element
+        self.in_references += step * is_reference
+        self.in_skipped += step * skips_text
+        self.in_preserved += step * preserves_whitespace
+
+    def handle_data(self, data):
+        self.current.append(data)
+
+    def handle_charref(self, name):
+        if name[0] in "xX":
+            codepoint = int(name.lstrip("xX"), 16)
+        else:
+            codepoint = int(name)
+        data = None
+        if codepoint < 256:
+            # numeric references below 256 are often meant as windows-1252
+            try:
+                data = bytearray([codepoint]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(codepoint)
+            except (ValueError, OverflowError):
+                pass
+        self.current.append(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.current.append(character if character is not None else "&" + name)
+
+    def unknown_decl(self, data):
+        # CDATA sections are part of the text, other declarations are not
+        self.end_data()
+        if data.upper().startswith("CDATA["):
+            self.current.append(data[len("CDATA["):])
+            self.end_data(cdata=True)
+
+    def handle_comment(self, data):
+        self.end_data()
+
+    def handle_decl(self, decl):
+        self.end_data()
+
+    def handle_pi(self, data):
+        self.end_data()
+
+    def take_text(self):
+        text = "".join(self.text)
+        self.text = []
+        return text
+
+    def close(self):
+        super().close()
+        self.end_data()
+
+
+def stream_text(html):
+    extractor = StreamTextExtractor()
+    extractor.feed(decode_html(html))
+    extractor.close()
+    return extractor.take_text()
+
+
+def iter_text_chunks(html, chunk_size=1 << 14):
+    # yields the text while the html is parsed chunk by chunk, the caller can stop parsing by not asking for more
+    html = decode_html(html)
+    extractor = StreamTextExtractor()
+    for start in range(0, len(html), chunk_size):
+        extractor.feed(html[start:start + chunk_size])
+        text = extractor.take_text()
+        if text:
+            yield text
+    extractor.close()
+    text = extractor.take_text()
+    if text:
+        yield text
+
+
+def lxml_text(html):
+    import lxml.html
+
+    root = lxml.html.document_fromstring(html)
+    for element in root.xpath(f"//*[contains(concat(' ', normalize-space(@class), ' '), ' {REFERENCE_CLASS} ')]"
+                              f" | //{' | //'.join(sorted(SKIPPED_TEXT_TAGS))}"):
+        # drop_tree keeps the text following the element
+        if element.getparent() is not None:
+            element.drop_tree()
+    return root.text_content()
+
+
+TEXT_BACKENDS = {
+    "bs4": bs4_text,
+    "stream": stream_text,
+    "lxml": lxml_text,
+}
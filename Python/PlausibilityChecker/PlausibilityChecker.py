@@ -4,6 +4,10 @@ import sys
 import re
 from bs4 import BeautifulSoup
 
+# papers can also be read from the per-year shards written by the downloader
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CHI_HTML_download"))
+from archive_shards import read_html_from_shards  # noqa: E402
+
 
 def generate_measure_mapping():
     # For each entry of effectsize_measure_unified in the effectsizes_measures3.csv file, generate a set of values from
@@ -136,8 +140,11 @@ def load_html(html_filename):
             soup = BeautifulSoup(html_content, "html.parser")
             html_text = soup.get_text()  # Rohtext aus dem HTML extrahieren
             return html_text
-    else:
+    # paper_dir ist ein Ordner mit Archiv-Shards: <paper_dir>/<year>-000.zip und <paper_dir>/<year>.index.jsonl
+    html_content = read_html_from_shards(html_filename)
+    if html_content is None:
         raise FileNotFoundError(f"File {html_filename} does not exist")
+    return BeautifulSoup(html_content, "html.parser").get_text()
 
 
 def analyze_csv(input_csv, output_csv, paper_dir, mapping_dict):
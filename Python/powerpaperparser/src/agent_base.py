@@ -15,6 +15,7 @@ from langchain_core.runnables.config import RunnableConfig
 from langgraph.graph.graph import CompiledGraph
 
 from chat_agent_base import BaseChatState
+from conversation_log import log_writer
 
 Context = TypeVar("Context")
 
@@ -52,6 +53,7 @@ class BaseAgent(Generic[Context]):
             verbose=False,
             md_file_name: Path | None = None,
             config: RunnableConfig | None = None,
+            append_markdown=True,
     ) -> BaseMessage:
         """
         runs the runnable and reports output to stout / markdown as configured
@@ -62,6 +64,8 @@ class BaseAgent(Generic[Context]):
             to_markdown: save conversation to md if True
             md_file_name: overwrite the md-filename (standard is current file name) if to_markdown is enabled
             config: config dict that will be passed to runnable.stream()
+            append_markdown: append only the new messages of every step to the md in the background instead of
+                rewriting the whole conversation
 
         Returns:
             The last AIMessage which should contain the answer to our problem
@@ -71,42 +75,78 @@ class BaseAgent(Generic[Context]):
             config = RunnableConfig()
 
         seen_message_count = 0
+        written_message_count = 0
 
-        for output in compiled_graph.stream(init_state, config, stream_mode="values"):
-            messages = output["messages"]
-            last_message: BaseMessage = messages[-1]
+        try:
+            for output in compiled_graph.stream(init_state, config, stream_mode="values"):
+                messages = output["messages"]
+                last_message: BaseMessage = messages[-1]
 
-            if to_stdout:
-                for msg in messages[seen_message_count:]:
-                    print()
-                    print(f"#### {msg.__class__.__name__} ".ljust(80, "#"))
-
-                    msg_dict = msg.dict()
-                    del msg_dict["content"]
-
-                    if isinstance(msg, AIMessage):
-                        print(f"[Model: {msg.response_metadata['model_name']}]")
-                        print()
-                    elif isinstance(msg, ToolMessage):
-                        print(f"[Tool: {msg.name}]")
+                if to_stdout:
+                    for msg in messages[seen_message_count:]:
                         print()
-                        del msg_dict["name"]
+                        print(f"#### {msg.__class__.__name__} ".ljust(80, "#"))
+
+                        msg_dict = msg.dict()
+                        del msg_dict["content"]
+
+                        if isinstance(msg, AIMessage):
+                            print(f"[Model: {msg.response_metadata['model_name']}]")
+                            print()
+                        elif isinstance(msg, ToolMessage):
+                            print(f"[Tool: {msg.name}]")
+                            print()
+                            del msg_dict["name"]
+
+                        print(msg.content)
+
+                        if not verbose:
+                            del msg_dict["additional_kwargs"]
+                            del msg_dict["response_metadata"]
+                        print(json.dumps(msg_dict, indent=4))
+
+                    seen_message_count = len(messages)
+
+                if to_markdown and append_markdown:
+                    # only the new messages are formatted and appended, the first step starts a new file
+                    log_writer.write(
+                        md_file_name or Path(f"{__name__.rsplit('.', maxsplit=1)[-1]}.md"),
+                        "".join(BaseAgent.message_to_markdown(msg) for msg in messages[written_message_count:]),
+                        truncate=written_message_count == 0,
+                    )
+                    written_message_count = len(messages)
+                elif to_markdown:
+                    BaseAgent.graph_output_to_markdown(
+                        output, output_file=md_file_name or Path(f"{__name__.rsplit('.', maxsplit=1)[-1]}.md")
+                    )
+        finally:
+            # the markdown file is complete when the run returns, also when it fails (e.g. GraphRecursionError)
+            log_writer.flush()
 
-                    print(msg.content)
+        return last_message
 
-                    if not verbose:
-                        del msg_dict["additional_kwargs"]
-                        del msg_dict["response_metadata"]
-                    print(json.dumps(msg_dict, indent=4))
+    @staticmethod
+    def message_to_markdown(msg: BaseMessage) -> str:
+        """
+        Format a single message of the conversation as markdown.
+        """
 
-                seen_message_count = len(messages)
+        out = f"#### {msg.__class__.__name__} \n"
 
-            if to_markdown:
-                BaseAgent.graph_output_to_markdown(
-                    output, output_file=md_file_name or Path(f"{__name__.rsplit('.', maxsplit=1)[-1]}.md")
-                )
+        if isinstance(msg, AIMessage):
+            out += f"Model: `{msg.response_metadata['model_name']}`\n\n"
+            out += f"{msg.content}\n\n"
+            if len(msg.tool_calls) > 0:
+                out += "*Tool calls*\n"
+                out += f"```json\n{json.dumps(msg.tool_calls, indent=4)}\n````\n"
+        elif isinstance(msg, ToolMessage):
+            out += f"Tool name: `{msg.name}`\n\n"
+            out += f"Result:\n{msg.content}\n"
+        else:
+            out += f"{msg.content}\n\n"
 
-        return last_message
+        out += "\n---\n\n"
+        return out
 
     @staticmethod
     def graph_output_to_markdown(output: dict, output_file: Path) -> None:
@@ -114,22 +154,5 @@ class BaseAgent(Generic[Context]):
         Create markdown file with formatted conversation from compiledGraph.stream() output.
         """
 
-        out = ""
-        for msg in output["messages"]:
-            out += f"#### {msg.__class__.__name__} \n"
-
-            if isinstance(msg, AIMessage):
-                out += f"Model: `{msg.response_metadata['model_name']}`\n\n"
-                out += f"{msg.content}\n\n"
-                if len(msg.tool_calls) > 0:
-                    out += "*Tool calls*\n"
-                    out += f"```json\n{json.dumps(msg.tool_calls, indent=4)}\n````\n"
-            elif isinstance(msg, ToolMessage):
-                out += f"Tool name: `{msg.name}`\n\n"
-                out += f"Result:\n{msg.content}\n"
-            else:
-                out += f"{msg.content}\n\n"
-
-            out += "\n---\n\n"
-
+        out = "".join(BaseAgent.message_to_markdown(msg) for msg in output["messages"])
         output_file.write_text(out, encoding="utf-8")
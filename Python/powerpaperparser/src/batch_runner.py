@@ -0,0 +1,63 @@
+"""Runs the PowerPaperParser Agent on many papers at the same time"""
+import concurrent.futures
+import contextlib
+import multiprocessing
+import os
+import traceback
+from pathlib import Path
+
+import chat_agent_base
+import rate_limiter
+from main_IDE import run_agent
+
+
+def init_worker(llm_request_slots, rate_limit_file, requests_per_minute, tokens_per_minute):
+    """Shares the limit of llm requests in flight and the rate limits with the agents of a worker process"""
+    chat_agent_base.llm_request_slots = llm_request_slots
+    rate_limiter.state_file = rate_limit_file
+    rate_limiter.requests_per_minute = requests_per_minute
+    rate_limiter.tokens_per_minute = tokens_per_minute
+
+
+def run_paper(html_path: Path, results_folder: Path) -> str | None:
+    """Runs the agent on one paper, its output goes to results/logs/<paper>.log, returns the error if it failed"""
+    log_folder = results_folder / "logs"
+    log_folder.mkdir(parents=True, exist_ok=True)
+    name = html_path.name[:-5]
+    with open(log_folder / f"{name}.log", "w", encoding="utf-8") as log_file, \
+            contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            run_agent(html_path, results_folder, message_log=log_folder / f"{name}.messages.log")
+        except Exception as e:  # pylint: disable=broad-except
+            # one failing paper must not stop the others, it is run again by the next batch
+            traceback.print_exc()
+            return repr(e)
+    return None
+
+
+def run_batch(paper_list: list, html_folder: str, results_folder=Path(__file__).parent.parent / 'results',
+              workers=4, max_llm_requests=4, requests_per_minute=None, tokens_per_minute=None) -> dict:
+    """Runs the agent on the papers without results in worker processes, returns the errors of the failed papers
+
+    Every worker processes one paper at a time, at most max_llm_requests llm calls of all workers are in flight.
+    The requests and tokens per minute (None for no limit) are shared by the workers through results/rate_limits.sqlite,
+    which is only used when a limit is set.
+    """
+    rate_limit_file = results_folder / "rate_limits.sqlite" if requests_per_minute or tokens_per_minute else None
+    results_folder.mkdir(parents=True, exist_ok=True)
+    todo = [paper for paper in paper_list if not os.path.isfile(results_folder / (paper[:-5] + ".json"))]
+    print(f"Starting Agent for {len(todo)} of {len(paper_list)} papers with {workers} workers")
+    llm_request_slots = multiprocessing.BoundedSemaphore(max_llm_requests)
+    failed = {}
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+                                                initargs=(llm_request_slots, rate_limit_file, requests_per_minute,
+                                                          tokens_per_minute)) as executor:
+        futures = {executor.submit(run_paper, Path(html_folder + "/" + paper), results_folder): paper
+                   for paper in todo}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            paper = futures[future]
+            error = future.result()
+            if error is not None:
+                failed[paper] = error
+            print(f"[{done}/{len(todo)}] {paper}: {'failed, ' + error if error else 'done'}")
+    return failed
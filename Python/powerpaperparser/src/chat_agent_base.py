@@ -1,9 +1,10 @@
 """Base class definition for basic chat agents with tool calling ability."""
 
+import contextlib
 import datetime
+import json
 import os
 import random
-import time
 from pathlib import Path
 from typing import Callable
 
@@ -13,7 +14,10 @@ from langchain_core.messages import AIMessage
 from langchain_core.messages import BaseMessage
 from langchain_core.messages import ToolCall
 from langchain_core.messages import ToolMessage
+from langchain_core.messages import messages_to_dict
 from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from langchain_core.runnables.config import RunnableConfig
 from langchain_core.tools import BaseTool
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import ToolExecutor
@@ -21,10 +25,17 @@ from langgraph.prebuilt import ToolInvocation
 from pydantic.v1 import BaseModel
 from pydantic.v1 import Field
 
+import llm_cache
+import rate_limiter
+from conversation_log import log_writer
 from logger import crs_logger
 
 log = crs_logger.getChild(__name__)
 
+# limits the llm requests in flight over all agents, set to a multiprocessing.BoundedSemaphore by batch_runner.py to
+# share the limit between its worker processes (None: no limit)
+llm_request_slots = None
+
 
 class BaseChatState(BaseModel):
     """
@@ -75,7 +86,7 @@ class SingleToolExecutorNode:
     def __init__(self, tools: list[BaseTool | Callable]):
         self.tool_executor = ToolExecutor(tools)
 
-    def _run_tool(self, tool_call):
+    def _run_tool(self, tool_call, config: RunnableConfig | None = None):
         tool_name = tool_call["name"]
 
         # when a tool is not registered but somewhere mentioned in a prompt the LLM might hallucinate a name
@@ -94,8 +105,9 @@ class SingleToolExecutorNode:
             tool=tool_name,
             tool_input=tool_call["args"],
         )
+        log.debug(f"Running tool {tool_name} ({tool_call['id']})")
 
-        result = self.tool_executor.invoke(invocation)
+        result = self.tool_executor.invoke(invocation, config)
         tool_message = ToolMessage(
             content=str(result),
             name=invocation.tool,
@@ -120,20 +132,43 @@ class SingleToolExecutorNode:
 class ToolExecutorNode(SingleToolExecutorNode):
     """
     Node which should be called after a model wants to execute a tool.
+    The tool calls of one AIMessage run concurrently on up to max_workers threads.
     """
 
-    def __call__(self, state: BaseChatState) -> BaseChatState:
+    def __init__(self, tools: list[BaseTool | Callable], max_workers: int = 8):
+        super().__init__(tools)
+        self.max_workers = max_workers
+
+    def __call__(self, state: BaseChatState, config: RunnableConfig | None = None) -> BaseChatState:
         """Call tool(s). Executes all tools that are uncalled in the last AIMessage"""
 
         last_ai_message = state.last_ai_message
 
-        tool_messages = [
-            self._run_tool(tool_call)
+        tool_calls = [
+            tool_call
             for tool_call in last_ai_message.tool_calls
             # ensure that we don't call a tool again that has been called by a previous (singular) call
             if state.get_unique_tool_id(tool_call, last_ai_message) not in state.processed_tools
         ]
 
+        if len(tool_calls) > 1 and self.max_workers > 1:
+            # the executor Runnable.batch uses, it copies the context (callbacks, tracing) into the threads of the
+            # submitted calls, batch itself cannot name the threads
+            # tools with run_in_order (e.g. report_test appending to its results) run on this thread one after the
+            # other in the order of the tool calls, while the others run in the pool
+            in_order = [getattr(self.tool_executor.tool_map.get(tool_call["name"]), "run_in_order", False)
+                        for tool_call in tool_calls]
+            with ContextThreadPoolExecutor(min(self.max_workers, len(tool_calls)),
+                                           thread_name_prefix="tool_executor") as executor:
+                futures = [None if ordered else executor.submit(self._run_tool, tool_call, config)
+                           for tool_call, ordered in zip(tool_calls, in_order)]
+                ordered_messages = {index: self._run_tool(tool_call, config)
+                                    for index, (tool_call, ordered) in enumerate(zip(tool_calls, in_order)) if ordered}
+                tool_messages = [ordered_messages[index] if future is None else future.result()
+                                 for index, future in enumerate(futures)]
+        else:
+            tool_messages = [self._run_tool(tool_call, config) for tool_call in tool_calls]
+
         state.processed_tools.update(
             state.get_unique_tool_id(tool_call, last_ai_message) for tool_call in last_ai_message.tool_calls
         )  # type: ignore
@@ -178,6 +213,8 @@ class CallModelNode:
             model_name: str,
             tools: list[BaseTool | Callable],
             temperature: float = 0.7,
+            message_log: Path | None = None,
+            append_log: bool = True,
     ) -> None:
 
         self.model_name = model_name
@@ -185,12 +222,17 @@ class CallModelNode:
         self.temperature = temperature
         self.model = get_model_with_tools(model_name, tools, temperature)
 
-        scratch_space = os.environ.get("AIXCC_CRS_SCRATCH_SPACE")
-        log_file = (
-            Path(scratch_space) / f"messages_{datetime.datetime.now()}.log" if scratch_space else Path("messages.log")
-        )
+        if message_log is None:
+            scratch_space = os.environ.get("AIXCC_CRS_SCRATCH_SPACE")
+            message_log = (
+                Path(scratch_space) / f"messages_{datetime.datetime.now()}.log" if scratch_space
+                else Path("messages.log")
+            )
 
-        self.message_log = log_file
+        self.message_log = message_log
+        # append only the new messages to the message log as JSON lines instead of rewriting the whole state
+        self.append_log = append_log
+        self.logged_message_count = 0
 
     def __call__(self, state: BaseChatState) -> BaseChatState:
         """Call model."""
@@ -199,20 +241,53 @@ class CallModelNode:
         if self.model_name == "":
             self.model = get_model_with_tools(random.choice(MODEL_LIST), self.tools, self.temperature)
 
-        self.message_log.write_text(state.json(indent=2), encoding="utf-8")
+        if self.append_log:
+            # written in the background, the first call of a run starts a new file
+            log_writer.write(
+                self.message_log,
+                "".join(json.dumps(message, default=str) + "\n"
+                        for message in messages_to_dict(state.messages[self.logged_message_count:])),
+                truncate=self.logged_message_count == 0,
+            )
+            self.logged_message_count = len(state.messages)
+        else:
+            self.message_log.write_text(state.json(indent=2), encoding="utf-8")
 
+        # an unchanged conversation of an earlier run gets the response it got then, without calling the api
+        response_cache = llm_cache.shared_cache()
+        key = llm_cache.cache_key(self.model, state.messages) if response_cache is not None else None
+        if key is not None and (response := response_cache.get(key)) is not None:
+            state.messages.append(response)
+            return state
+
+        limiter = rate_limiter.shared_limiter()
         # increased limit from 10k to 20k as paper would not finish
-        for _ in range(0, 20_000):
+        for attempt in range(0, 20_000):
+            # wait until the call fits into the requests and tokens per minute of all agents
+            tokens = rate_limiter.estimate_tokens(self.model, state.messages)
+            limiter.acquire(tokens)
             try:
-                response = self.model.invoke(state.messages)
+                try:
+                    # the slot is released before a backoff sleep
+                    with llm_request_slots or contextlib.nullcontext():
+                        response = self.model.invoke(state.messages)
+                except BaseException:
+                    # rate limit and api errors, timeouts, interrupts: the reserved tokens go back to the bucket
+                    limiter.settle(tokens, 0)
+                    raise
+                limiter.settle(tokens, rate_limiter.used_tokens(response))
+                if key is not None:
+                    response_cache.put(key, response)
                 state.messages.append(response)
                 break
             except openai.RateLimitError as e:
-                if e.code == 429:
-                    # ignore "No deployments available for selected model"
-                    log.warning('Ignoring LiteLLM API error "No deployments available for selected model"')
-                    print(f"RATE LIMIT ERROR IGNORED: {e!r}")
-                    time.sleep(10)  # backoff time
+                # an exhausted quota does not come back by waiting
+                if e.code != "insufficient_quota":
+                    # pause all agents until the limit resets, without reset headers back off exponentially
+                    delay = rate_limiter.reset_delay(e.response.headers) or rate_limiter.backoff_delay(attempt)
+                    log.warning(f"Rate limit error, pausing the llm calls for {delay:.1f} seconds")
+                    print(f"RATE LIMIT ERROR, PAUSING FOR {delay:.1f} SECONDS: {e!r}")
+                    limiter.pause(delay)
                 else:
                     raise
             except openai.AuthenticationError as e:
@@ -225,7 +300,8 @@ class CallModelNode:
                     print(f"MAX BUDGET EXCEED: {e!r}.\n\nGOING TO SLEEP FOR {timeout} SECONDS")
                     # we do this to keep the logs clean, because container will restart
                     # forever and logs will be polluted with this error
-                    time.sleep(timeout)
+                    # the pause is shared, so the other agents do not run into the same error
+                    limiter.pause(timeout)
                 else:
                     raise
         else:
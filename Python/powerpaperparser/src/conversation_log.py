@@ -0,0 +1,79 @@
+"""Buffered append-only writing of the conversation logs, off the thread running the agent"""
+
+import atexit
+import os
+import queue
+import threading
+from pathlib import Path
+
+from logger import crs_logger
+
+log = crs_logger.getChild(__name__)
+
+
+class LogWriter:
+    """Writes text to log files in a background thread
+
+    Texts queued for the same file one after the other are written with a single write.
+    flush() waits until everything queued so far is written.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def write(self, path: Path, text: str, truncate=False):
+        """Queues text to append to a file, with truncate the file is emptied first (e.g. at the start of a run)"""
+        self._ensure_thread()
+        self._queue.put((Path(path), text, truncate))
+
+    def flush(self):
+        """Waits until all queued texts are written"""
+        if self._thread is not None and self._pid == os.getpid():
+            # a writer thread that died is restarted for the texts still queued
+            self._ensure_thread()
+            self._queue.join()
+
+    def _ensure_thread(self):
+        # a forked worker process does not inherit the thread, it starts its own
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="conversation-log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            # everything queued in the meantime is written in the same batch
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            try:
+                self._write_batch(items)
+            except Exception as e:  # pylint: disable=broad-except
+                # a log that cannot be written must not stop the agent or leave flush() waiting forever
+                log.error(f"Could not write conversation log: {e!r}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _write_batch(items):
+        batches = []
+        for path, text, truncate in items:
+            if batches and batches[-1][0] == path and not truncate:
+                batches[-1][1].append(text)
+            else:
+                batches.append((path, [text], truncate))
+        for path, texts, truncate in batches:
+            with open(path, "w" if truncate else "a", encoding="utf-8") as log_file:
+                log_file.write("".join(texts))
+
+
+# writer shared by all logs of a process
+log_writer = LogWriter()
+atexit.register(log_writer.flush)
@@ -0,0 +1,94 @@
+"""Persistent cache of the llm responses of CallModelNode, reruns of a conversation replay the unchanged calls"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from langchain_core.messages import messages_from_dict
+from langchain_core.messages import messages_to_dict
+
+# SQLite file with the cached responses, shared by all processes, None turns the cache off
+cache_file: Path | None = Path(__file__).parent.parent / "llm_cache.sqlite"
+# the least recently used responses are deleted when the cached responses get larger than this
+max_size_mb = 500
+
+# fields that differ between two runs of the same conversation and are not sent to the api
+VOLATILE_FIELDS = {"id", "response_metadata", "usage_metadata"}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def cache_key(model, messages) -> str:
+    """Returns the hash of everything that determines a response: model settings, bound kwargs and messages"""
+    # bind_tools wraps the chat model and keeps the tool schemas, tool_choice etc. in its kwargs
+    chat_model = getattr(model, "bound", model)
+    data = {
+        "model": chat_model.model_name,
+        # temperature, max_tokens, n, ... as sent with every request
+        "params": getattr(chat_model, "_default_params", {"temperature": chat_model.temperature}),
+        "kwargs": getattr(model, "kwargs", {}),
+        "messages": [{"type": message["type"],
+                      "data": {key: value for key, value in message["data"].items() if key not in VOLATILE_FIELDS}}
+                     for message in messages_to_dict(messages)],
+    }
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Responses by cache key in SQLite, with least recently used eviction above a size limit"""
+
+    def __init__(self, db_path: Path, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(key TEXT PRIMARY KEY, response BLOB, size INTEGER, last_used REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str):
+        """Returns the cached response message, None if the call was not cached"""
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return messages_from_dict(json.loads(zlib.decompress(row[0]).decode("utf-8")))[0]
+
+    def put(self, key: str, response):
+        """Caches a response message and evicts the least recently used ones above the size limit"""
+        data = zlib.compress(json.dumps(messages_to_dict([response])).encode("utf-8"))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                 (key, data, len(data), time.time()))
+                total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    evicted = 0
+                    for old_key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used")\
+                            .fetchall():
+                        if total - evicted <= self.max_bytes:
+                            break
+                        self._db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                        evicted += size
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+
+def shared_cache() -> ResponseCache | None:
+    """Returns the cache of this process, created with the settings above on first use (None if it is turned off)"""
+    global _cache  # pylint: disable=global-statement
+    if cache_file is None:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(cache_file, max_size_mb * 1024 * 1024)
+        return _cache
@@ -12,7 +12,7 @@ from pathlib import Path
 
 def init_logging() -> logging.Logger:
     """Logger init helper."""
-    formatter = logging.Formatter("[%(asctime)s.%(msecs)d][%(levelname)s][%(name)s] %(message)s")
+    formatter = logging.Formatter("[%(asctime)s.%(msecs)d][%(levelname)s][%(name)s][%(threadName)s] %(message)s")
     formatter.datefmt = "%Y-%m-%d %H:%M:%S"
 
     logger = logging.getLogger("CRS")
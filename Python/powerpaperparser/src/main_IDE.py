@@ -1,19 +1,22 @@
 """Main of PowerPaperParser Agent"""
+import csv
 import json
 import os
 from pathlib import Path
 
+import rate_limiter
 from langgraph.errors import GraphRecursionError
 from minimal_CCS_extraction import get_header
 from power_paper_parser_agent import PowerPaperParserAgent
 from power_paper_parser_agent import PowerPaperParserAgentContext
 
-def start_agent(path: Path, result_path: Path) -> list:
-    """Function to run the agent"""
+def start_agent(path: Path, result_path: Path, message_log: Path | None = None) -> PowerPaperParserAgentContext:
+    """Function to run the agent, returns the context with the reported tests and the CCS header"""
     context = PowerPaperParserAgentContext(
         paperPath=path,
         result=[],
-        result_path=result_path
+        result_path=result_path,
+        message_log=message_log
     )
     agent = PowerPaperParserAgent()
 
@@ -23,10 +26,11 @@ def start_agent(path: Path, result_path: Path) -> list:
     except GraphRecursionError as e:
         print(f"{e}")
 
-    return context.result
+    return context
 
 
-def run_agent(html_path: Path, results_folder=Path(__file__).parent.parent / 'results'):
+def run_agent(html_path: Path, results_folder=Path(__file__).parent.parent / 'results',
+              message_log: Path | None = None):
     """The run function!"""
     # Extract the name of the HTML file
     html_filename = html_path.name
@@ -36,16 +40,37 @@ def run_agent(html_path: Path, results_folder=Path(__file__).parent.parent / 're
     result_txt_path = results_folder / f"{html_filename[:-5]}.json"
 
     # acquire results
-    result = start_agent(html_path, results_folder / f"{html_filename[:-5]}.md")
-    # get header and ccs
-    ccs_header = get_header(html_path)
+    context = start_agent(html_path, results_folder / f"{html_filename[:-5]}.md", message_log)
+    # get header and ccs, loaded together with the parsed paper when the agent started
+    ccs_header = context.header if context.header is not None else get_header(html_path)
     # merge the two
-    ccs_header.update({"tests": result})
+    ccs_header.update({"tests": context.result})
     # dump the result into a json file
     with open(result_txt_path, 'w', encoding="utf-8") as json_file:
         json.dump(ccs_header, json_file, indent=4)
 
 
+def order_by_triage(paper_list: list, triage_csv, min_density=0.0) -> list:
+    """Sorts the papers by the statistics density of the triage csv and drops the ones below min_density"""
+    density = {}
+    with open(triage_csv, 'r', encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=';')
+        if not {"Paper", "density"} <= set(reader.fieldnames or []):
+            raise ValueError(f"{triage_csv} has no Paper and density columns, write it with triage = True "
+                             f"(and fast_triage = False) in quantitative_filtering.py")
+        for row in reader:
+            density[Path(row["Paper"]).name] = float(row["density"])
+    ranked = [paper for paper in paper_list if paper in density and density[paper] >= min_density]
+    skipped = [paper for paper in paper_list if paper in density and density[paper] < min_density]
+    # papers without a triage result are kept at the end
+    unranked = [paper for paper in paper_list if paper not in density]
+    if skipped:
+        print(f"Skipping {len(skipped)} papers with a statistics density below {min_density}")
+    if unranked:
+        print(f"{len(unranked)} papers are not in {triage_csv}, they are processed last")
+    return sorted(ranked, key=lambda paper: -density[paper]) + unranked
+
+
 if __name__ == "__main__":
     from settings import *
 
@@ -55,8 +80,19 @@ if __name__ == "__main__":
             OPENAI_API_KEY = file.read()
         os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
 
-    for paper in papers:
-        if os.path.isfile(Path(__file__).parent.parent / "results" / (paper[:-5] + ".json")):
-            continue
-        print("Starting Agent for Paper:", paper)
-        run_agent(Path(html_folder_path + "/" + paper))
+    if triage_csv is not None:
+        papers = order_by_triage(papers, triage_csv, min_density)
+
+    rate_limiter.requests_per_minute = requests_per_minute
+    rate_limiter.tokens_per_minute = tokens_per_minute
+
+    if workers > 1:
+        from batch_runner import run_batch
+        run_batch(papers, html_folder_path, workers=workers, max_llm_requests=max_llm_requests,
+                  requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+    else:
+        for paper in papers:
+            if os.path.isfile(Path(__file__).parent.parent / "results" / (paper[:-5] + ".json")):
+                continue
+            print("Starting Agent for Paper:", paper)
+            run_agent(Path(html_folder_path + "/" + paper))
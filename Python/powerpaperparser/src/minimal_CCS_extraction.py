@@ -3,6 +3,11 @@ from pathlib import Path
 
 import html2text
 
+from paper_parser import read_html
+
+# bump when the header extraction below changes, the headers cached by paper_cache.py are then extracted again
+HEADER_VERSION = 1
+
 CCS_TOP_CLASSES = [
     "general and reference",
     "hardware",
@@ -411,7 +416,7 @@ class CleanedPaper:  # structure to store all information about a fully extracte
     # extract Content of html files into plain txt format for easier handling and content extraction
 
 
-def get_plaintext(html_input_path):
+def get_plaintext(html_input_path, html_content=None):
     # initialize html2text converter with bundle of options listed below
     html_converter = html2text.HTML2Text()
     html_converter.ignore_links = True
@@ -423,8 +428,7 @@ def get_plaintext(html_input_path):
     html_converter.use_automatic_links = False
     html_converter.body_width = 0  # no body_width so no inserted linebreaks
     html_converter.white_space_trim = True
-    with open(html_input_path, "r", encoding="utf-8") as html_content:
-        text = html_converter.handle(html_content.read())
+    text = html_converter.handle(read_html(html_input_path) if html_content is None else html_content)
     return text
 
 
@@ -507,8 +511,8 @@ def clean_paper(plain_text):
                         specified_class=specified_class)  # return cleanedPaper instance with all fields setted
 
 
-def get_header(html_path: Path):
-    plaintext = get_plaintext(html_path)
+def get_header(html_path: Path, html_content=None):
+    plaintext = get_plaintext(html_path, html_content)
     result = clean_paper(plaintext)
     # if paper contains "undefined" in ccs column, it is most likely not in the correct format and therefor not usable.
     if not result.ccs == "undefined":
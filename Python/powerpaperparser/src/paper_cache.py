@@ -0,0 +1,100 @@
+"""Module to cache parsed papers on disk
+"""
+import hashlib
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from minimal_CCS_extraction import HEADER_VERSION
+from minimal_CCS_extraction import get_header
+from paper_parser import PARSER_VERSION
+from paper_parser import PaperParser
+from paper_parser import ParsedPaper
+from paper_parser import SectionRecord
+from paper_parser import TableRecord
+from paper_parser import read_html
+
+# folder with one <sha256 of the html>-v<parser version>-h<header version>.json.z file per parsed paper, delete it to
+# parse everything again (entries of older parser or header versions are not read anymore and can be deleted as well)
+cache_folder = Path(__file__).parent.parent / "parsed_papers"
+
+
+@dataclass(slots=True)
+class CachedPaper:
+    """Parser answering from the parsed paper and the CCS header of a paper"""
+    parser: PaperParser
+    header: dict
+
+
+def cache_key(html_content: str) -> str:
+    """Returns the name of the cache file of a paper, changed papers, parser and header versions get a new file"""
+    return f"{hashlib.sha256(html_content.encode('utf-8')).hexdigest()}-v{PARSER_VERSION}-h{HEADER_VERSION}.json.z"
+
+
+def encode_paper(paper: ParsedPaper, header: dict) -> bytes:
+    """Returns the parsed paper and the header as compressed JSON, the records are stored as plain lists"""
+    data = {
+        "title": paper.title,
+        "abstract": paper.abstract,
+        "section_index": paper.section_index,
+        "table_index": paper.table_index,
+        "sections": [[section.number, section.header_titles, section.text] for section in paper.sections],
+        "tables": {index: [table.title, table.rows] for index, table in paper.tables.items()},
+        "header": header,
+    }
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_paper(data: bytes) -> tuple[ParsedPaper, dict]:
+    """Returns the parsed paper and the header of encode_paper"""
+    data = json.loads(zlib.decompress(data).decode("utf-8"))
+    paper = ParsedPaper(
+        title=data["title"],
+        abstract=data["abstract"],
+        section_index=tuple(tuple(entry) for entry in data["section_index"]),
+        table_index=tuple(tuple(entry) for entry in data["table_index"]),
+        sections=tuple(SectionRecord(number, tuple(titles), text) for number, titles, text in data["sections"]),
+        tables={index: TableRecord(title, tuple(tuple(row) for row in rows))
+                for index, (title, rows) in data["tables"].items()},
+    )
+    return paper, data["header"]
+
+
+def load_paper(html_path: Path, folder: Path | None = None) -> CachedPaper:
+    """Returns the parsed paper and the CCS header from the cache, parses and caches the paper if it is not in it"""
+    folder = Path(folder or cache_folder)
+    html_content = read_html(html_path)
+    cache_file = folder / cache_key(html_content)
+    if cache_file.is_file():
+        paper, header = decode_paper(cache_file.read_bytes())
+        return CachedPaper(PaperParser(html_path, paper=paper), header)
+    parser = PaperParser(html_path, low_memory=True, html_content=html_content)
+    try:
+        header = get_header(html_path, html_content)
+    except IndexError:
+        # papers without a DOI line, the header is extracted before the agent runs now, so they must not stop it
+        header = {"title": "error in CCS extraction"}
+    folder.mkdir(parents=True, exist_ok=True)
+    # written under a temporary name first, so other processes never read a partially written file
+    temp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    temp_file.write_bytes(encode_paper(parser.paper, header))
+    os.replace(temp_file, cache_file)
+    return CachedPaper(parser, header)
+
+
+def test(path: Path):
+    """Test the cache against a freshly parsed paper"""
+    print(f"Testing: {path}")
+    expected = PaperParser(path).paper
+    first = load_paper(path)
+    second = load_paper(path)
+    print("parsed paper unchanged:", first.parser.paper == expected and second.parser.paper == expected)
+    print("header unchanged:", first.header == second.header == get_header(path))
+
+
+if __name__ == "__main__":
+    folder = Path("")
+    paper = folder / "3580810.html"
+    test(paper)
@@ -3,38 +3,129 @@
 import csv
 import io
 import re
+import sys
+import threading
 from copy import copy
+from dataclasses import dataclass
+from dataclasses import field
 from pathlib import Path
 
 from bs4 import BeautifulSoup
 
+sys.path.append(str(Path(__file__).resolve().parents[2] / "CHI_HTML_download"))
+from archive_shards import read_html_from_shards  # noqa: E402
+
+
+# bump when the parsing below changes, the parsed papers cached by paper_cache.py are then parsed again
+PARSER_VERSION = 1
+
+
+def read_html(html_path: Path) -> str:
+    """Reads a paper from its HTML file or, if there is none, from the archive shards of the downloader"""
+    if Path(html_path).is_file():
+        with open(html_path, encoding="utf-8") as html_file:
+            return html_file.read()
+    html_content = read_html_from_shards(html_path)
+    if html_content is None:
+        raise FileNotFoundError(f"File {html_path} does not exist")
+    return html_content.decode("utf-8")
+
+
+@dataclass(slots=True)
+class SectionRecord:
+    """Text of a section without tables and figures, with its number and the titles of its headers"""
+    # the first section number found in the section, None if it has none
+    number: str | None
+    # the titles of all headers in the section, including the ones of its subsections
+    header_titles: tuple[str, ...]
+    text: str
+
+
+@dataclass(slots=True)
+class TableRecord:
+    """Title and cells of a table"""
+    title: str
+    rows: tuple[tuple[str, ...], ...]
+
+    def to_csv(self) -> str:
+        """Returns the cells as CSV"""
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerows(self.rows)
+        return output.getvalue()
+
+
+@dataclass(slots=True)
+class ParsedPaper:
+    """Everything the agent and its tools read from a paper, without the BeautifulSoup tree"""
+    title: str | None
+    abstract: str | None
+    # (index, title) of the sections and tables as listed in the prompt
+    section_index: tuple[tuple[str, str], ...]
+    table_index: tuple[tuple[str, str], ...]
+    sections: tuple[SectionRecord, ...]
+    # by table index, the first table with an index
+    tables: dict[str, TableRecord]
+    # by section number, the text of the first section with the number (built from sections)
+    section_texts: dict[str, str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.section_texts = {}
+        for section in self.sections:
+            if section.number is not None:
+                self.section_texts.setdefault(section.number, section.text)
+
 
 class PaperParser:
-    """Class to parse CHI papers"""
+    """Class to parse CHI papers
 
-    def __init__(self, html_path: Path):
+    All lookups are answered from a ParsedPaper that is built from the BeautifulSoup tree on first access.
+    With low_memory=True it is built right away and the tree is discarded.
+    An already parsed paper (e.g. from paper_cache.py) can be passed instead, the HTML is then not read at all.
+    """
+
+    def __init__(self, html_path: Path, low_memory=False, html_content: str | None = None,
+                 paper: ParsedPaper | None = None):
         self.html_path = html_path
-        with open(html_path, encoding="utf-8") as html_file:
-            html_content = html_file.read()
+        self._index_lock = threading.Lock()
+        self._paper = paper
+        if paper is not None:
+            self.soup = None
+            return
+        if html_content is None:
+            html_content = read_html(html_path)
         self.soup = BeautifulSoup(html_content, "html.parser")
+        if low_memory:
+            self.release_soup()
 
-    def get_title(self) -> str:
-        """Returns the title of a paper"""
-        title_tag = self.soup.find("title")
-        if title_tag is None:
-            raise RuntimeError("Title not found!")
-        return title_tag.text.strip()
+    @property
+    def paper(self) -> ParsedPaper:
+        """The parsed paper, built on first access"""
+        if self._paper is None:
+            with self._index_lock:
+                if self._paper is None:
+                    self._paper = self._parse()
+        return self._paper
 
-    def get_abstract(self) -> str:
-        """Returns the abstract of a paper"""
+    def release_soup(self):
+        """Builds the parsed paper and discards the BeautifulSoup tree"""
+        _ = self.paper
+        self.soup = None
+
+    def _parse(self) -> ParsedPaper:
+        """Extracts everything from the BeautifulSoup tree once"""
+        title_tag = self.soup.find("title")
         abstract_tag = self.soup.find("div", class_="abstract")
-        if abstract_tag is None:
-            raise RuntimeError("Abstract not found!")
-        return abstract_tag.text.strip()
+        return ParsedPaper(
+            title=title_tag.text.strip() if title_tag is not None else None,
+            abstract=abstract_tag.text.strip() if abstract_tag is not None else None,
+            section_index=tuple(self._parse_section_index()),
+            table_index=tuple(self._parse_table_index()),
+            sections=tuple(self._parse_sections()),
+            tables=self._parse_tables(),
+        )
 
-    def get_section_index(self):
-        """Returns the index of a paper"""
-        index = []
+    def _parse_section_index(self):
         pattern = re.compile(r"^sec")
         sections = self.soup.find_all("section", id=pattern)
         for section in sections:
@@ -47,12 +138,9 @@ class PaperParser:
                 unwanted_sections = ["references", "acknowledgments", "acknoweldgements", "footnote", "appendix"]
                 if any(section_name in section_title.lower() for section_name in unwanted_sections):
                     continue
-                index.append({"index": section_number.text.strip() if section_number else "", "title": section_title})
-        return index
+                yield section_number.text.strip() if section_number else "", section_title
 
-    def get_table_index(self):
-        """Returns the index of tables"""
-        index = []
+    def _parse_table_index(self):
         for table_div in self.soup.find_all("div", class_="table-responsive"):
             id_value = table_div.get("id", "")
             # skip if the id is not present
@@ -62,10 +150,74 @@ class PaperParser:
             table_index = re.search(r'\d+', id_value).group()
             caption = table_div.find("div", class_="table-caption")
             if caption:
-                table_title = (caption.find("span", class_="table-title").
-                               text.strip()) if caption.find("span", class_="table-title") else ""
-                index.append({"index": table_index, "title": table_title})
-        return index
+                yield table_index, self._table_title(table_div)
+
+    def _parse_sections(self):
+        pattern = re.compile(r"^sec")
+        for section in self.soup.find_all("section", id=pattern):
+            section_number = section.find(class_="section-number")
+            titles = []
+            for header in section.find_all("header"):
+                title_info = header.find("div", class_="title-info")
+                if title_info is not None:
+                    titles.append(title_info.get_text().strip())
+            yield SectionRecord(section_number.get_text().strip() if section_number else None, tuple(titles),
+                                self._cleaned_section_text(section))
+
+    def _parse_tables(self):
+        tables = {}
+        for table_div in self.soup.find_all("div", class_="table-responsive"):
+            id_value = table_div.get("id", "")
+            # skip if the id is not present or just an equation
+            if not id_value or "tab" not in id_value:
+                continue
+            # remove the "tab" from the table id after getting it
+            table_index = re.search(r'\d+', id_value).group()
+            if table_index not in tables:
+                rows = tuple(tuple(cell.get_text(strip=True) for cell in row.find_all(['th', 'td']))
+                             for row in table_div.find_all('tr'))
+                tables[table_index] = TableRecord(self._table_title(table_div), rows)
+        return tables
+
+    @staticmethod
+    def _table_title(table_div) -> str:
+        """Returns the title of a table"""
+        caption = table_div.find("div", class_="table-caption")
+        if caption:
+            return (caption.find("span", class_="table-title").
+                    text.strip()) if caption.find("span", class_="table-title") else ""
+        return ""
+
+    def _cleaned_section_text(self, section) -> str:
+        """Returns the text of a section without its tables and figures"""
+        section_copy = copy(section)
+        # Remove any tables
+        for table_div in section_copy.find_all("div", class_="table-responsive"):
+            table_div.decompose()
+        # Remove any figures
+        for figure_to_remove in section_copy.find_all("figure"):
+            figure_to_remove.decompose()
+        return self.clean_cite(section_copy.get_text())
+
+    def get_title(self) -> str:
+        """Returns the title of a paper"""
+        if self.paper.title is None:
+            raise RuntimeError("Title not found!")
+        return self.paper.title
+
+    def get_abstract(self) -> str:
+        """Returns the abstract of a paper"""
+        if self.paper.abstract is None:
+            raise RuntimeError("Abstract not found!")
+        return self.paper.abstract
+
+    def get_section_index(self):
+        """Returns the index of a paper"""
+        return [{"index": index, "title": title} for index, title in self.paper.section_index]
+
+    def get_table_index(self):
+        """Returns the index of tables"""
+        return [{"index": index, "title": title} for index, title in self.paper.table_index]
 
     @staticmethod
     def replace_match(match):
@@ -80,81 +232,22 @@ class PaperParser:
 
     def get_section_text_by_index(self, index):
         """Returns the section text for a given index"""
-
-        pattern = re.compile(r"^sec")
-        sections = self.soup.find_all("section", id=pattern)
-        for section in sections:
-            section_number = section.find(class_="section-number")
-            if section_number and section_number.get_text().strip() == str(index):
-                section_copy = copy(section)
-                # Remove any tables
-                for table_div in section_copy.find_all("div", class_="table-responsive"):
-                    table_div.decompose()
-                # Remove any figures
-                for figure_to_remove in section_copy.find_all("figure"):
-                    figure_to_remove.decompose()
-                return self.clean_cite(section_copy.get_text())
+        if str(index) in self.paper.section_texts:
+            return self.paper.section_texts[str(index)]
         raise ValueError(f'No section with index "{index}" available!')
 
     def get_table_by_index(self, index) -> (str, str):
         """Returns the table as CSV"""
-
-        def table_to_csv_string(table_bs4):
-            # Create a StringIO object to hold the CSV data
-            output = io.StringIO()
-            writer = csv.writer(output)
-
-            # Find the table rows
-            rows = table_bs4.find_all('tr')
-
-            for row in rows:
-                # Find all the cells in the row
-                cells = row.find_all(['th', 'td'])
-                # Extract text from each cell
-                cell_texts = [cell.get_text(strip=True) for cell in cells]
-                # Write the row to the CSV
-                writer.writerow(cell_texts)
-
-            # Get the CSV string from the StringIO object
-            csv_string = output.getvalue()
-            output.close()
-
-            return csv_string
-
-        for table_div in self.soup.find_all("div", class_="table-responsive"):
-            id_value = table_div.get("id", "")
-            # skip if the id is not present or just an equation
-            if not id_value or "tab" not in id_value:
-                continue
-            # remove the "tab" from the table id after getting it
-            table_index = re.search(r'\d+', id_value).group()
-            caption = table_div.find("div", class_="table-caption")
-            if caption:
-                table_title = (caption.find("span", class_="table-title").
-                               text.strip()) if caption.find("span", class_="table-title") else ""
-            else:
-                table_title = ""
-            if index == table_index:
-                return table_title, table_to_csv_string(table_div)
+        if index in self.paper.tables:
+            table = self.paper.tables[index]
+            return table.title, table.to_csv()
         raise ValueError(f'No table with index "{index}" available!')
 
     def get_section_text_by_title(self, title):
         """Returns the section text for a given title"""
-        pattern = re.compile(r"^sec")
-        sections = self.soup.find_all("section", id=pattern)
-        for section in sections:
-            headers = section.find_all("header")
-            for header in headers:
-                title_info = header.find("div", class_="title-info")
-                if title_info.get_text().strip().endswith(title):
-                    section_copy = copy(section)
-                    # Remove any tables
-                    for table_div in section_copy.find_all("div", class_="table-responsive"):
-                        table_div.decompose()
-                    # Remove any figures
-                    for figure_to_remove in section_copy.find_all("figure"):
-                        figure_to_remove.decompose()
-                    return self.clean_cite(section_copy.get_text())
+        for section in self.paper.sections:
+            if any(header_title.endswith(title) for header_title in section.header_titles):
+                return section.text
         raise ValueError(f'No section with title "{title}" available!')
 
 
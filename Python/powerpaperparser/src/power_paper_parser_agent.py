@@ -19,11 +19,14 @@ from agent_base import BaseAgent
 from chat_agent_base import BaseChatState
 from chat_agent_base import CallModelNode
 from chat_agent_base import ToolExecutorNode
+from paper_cache import load_paper
 from paper_parser import PaperParser
 from powerpaperparser_agent_tools import ReportTestTool, TableReadTool
 from powerpaperparser_agent_tools import SectionReadTool
 from prompt import get_prompt
 from prompt import get_system_prompt
+from stats_localization import format_hit_map
+from stats_localization import get_stats_hit_map
 
 
 class PowerPaperParserAgentContext(BaseModel):
@@ -32,6 +35,10 @@ class PowerPaperParserAgentContext(BaseModel):
     paperPath: Path
     result: list[dict[Any, Any]]
     result_path: Path
+    # file the state is written to before every llm call, None for messages.log
+    message_log: Path | None = None
+    # CCS header of the paper, set by run from the paper cache (None if the paper was parsed without it)
+    header: dict | None = None
 
 
 class AgentState(BaseChatState):
@@ -63,14 +70,25 @@ class PowerPaperParserAgent(BaseAgent[PowerPaperParserAgentContext]):
     """
 
     @staticmethod
-    def run(ctx: PowerPaperParserAgentContext, recursion_limit=300, temperature=0) -> PowerPaperParserAgentContext:
-        pp = PaperParser(ctx.paperPath)
+    def run(ctx: PowerPaperParserAgentContext, recursion_limit=300, temperature=0,
+            localize_stats=True, low_memory=True, use_cache=True) -> PowerPaperParserAgentContext:
+        # with use_cache a paper that was parsed before is read from paper_cache.py instead of parsing the HTML again
+        # with low_memory the tools read from the parsed paper and the BeautifulSoup tree is released right away
+        # the CCS header is cached with the parsed paper and handed back on the context
+        if use_cache:
+            cached = load_paper(ctx.paperPath)
+            pp, ctx.header = cached.parser, cached.header
+        else:
+            pp = PaperParser(ctx.paperPath, low_memory=low_memory)
+        # tell the agent in which sections and tables the filters found statistics
+        stats_locations = format_hit_map(get_stats_hit_map(pp)) if localize_stats else None
         reporttool = ReportTestTool()
 
         tools: list[BaseTool | Callable] = [SectionReadTool(paperparser=pp), TableReadTool(paperparser=pp), reporttool]
 
         # definition of nodes
-        call_model = CallModelNode(model_name="gpt-4o", temperature=temperature, tools=tools)
+        call_model = CallModelNode(model_name="gpt-4o", temperature=temperature, tools=tools,
+                                   message_log=ctx.message_log)
         run_tool = ToolExecutorNode(tools)
 
         # topology of graph
@@ -90,7 +108,8 @@ class PowerPaperParserAgent(BaseAgent[PowerPaperParserAgentContext]):
                 SystemMessage(content=get_system_prompt()),
                 HumanMessage(
                     content=get_prompt(title=pp.get_title(), abstract=pp.get_abstract(),
-                                       section_index=pp.get_section_index(), table_index=pp.get_table_index())
+                                       section_index=pp.get_section_index(), table_index=pp.get_table_index(),
+                                       stats_locations=stats_locations)
                 ),
             ]
         )
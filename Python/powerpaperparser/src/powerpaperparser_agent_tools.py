@@ -81,6 +81,8 @@ class ReportTestTool(BaseTool):
 
     args_schema: type[BaseModel] = ReportTestArgs
     tests: List[dict] = []
+    # the other tool calls of a model turn run in parallel threads, the tests are reported in the order of the calls
+    run_in_order: bool = True
 
     # pylint: disable=arguments-differ
     def _run(
@@ -75,7 +75,21 @@ Cox-and-Snell R-squared
 """
 
 
-def get_task_agent(title: str, abstract: str, section_index: str, table_index: str) -> str:
+def get_stats_locations(stats_locations: str | None) -> str:
+    """where the keyword search of the quantitative filtering found statistics, empty if it was not run"""
+    if stats_locations is None:
+        return ""
+    return f"""
+A keyword search for p-values, confidence intervals, Bayes factors and effect sizes found the following matches in the sections and tables:
+```
+{stats_locations}
+```
+Start with these sections and tables. The other sections are unlikely to contain test results, only read them if you need their context, e.g. the sample size or the study design.
+"""
+
+
+def get_task_agent(title: str, abstract: str, section_index: str, table_index: str,
+                   stats_locations: str | None = None) -> str:
     """Get the task for the agent"""
     return f"""
 You need to extract the number of participants in the study, i.e. the sample size.
@@ -116,7 +130,7 @@ And the following tables:
 ```
 {table_index}
 ```
-Analyze the paper using your tools and make sure to report every test with its parameters.
+{get_stats_locations(stats_locations)}Analyze the paper using your tools and make sure to report every test with its parameters.
 Remember to also report effect sizes that are not explicitly stated including but not limited to:
 - correlation coefficients.
 - Odds Ratio (OR)
@@ -130,9 +144,10 @@ After reviewing the sections, have a look at the relevant tables.
 """
 
 
-def get_prompt(title: str, abstract: str, section_index: str, table_index: str, include_persona=True):
+def get_prompt(title: str, abstract: str, section_index: str, table_index: str, include_persona=True,
+               stats_locations: str | None = None):
     """get the prompt for the powerpaper agent"""
     return f"""
 {get_persona_desc() if include_persona else ''}
-{get_task_agent(title, abstract, section_index, table_index)}
+{get_task_agent(title, abstract, section_index, table_index, stats_locations)}
 """
@@ -0,0 +1,180 @@
+"""Requests and tokens per minute limiter for the llm calls of CallModelNode"""
+
+import contextlib
+import random
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# limits of the OpenAI account (https://platform.openai.com/settings/organization/limits), None turns a limit off,
+# the limiter keeps the calls just under them instead of running into rate limit errors (set from settings.py)
+requests_per_minute: int | None = None
+tokens_per_minute: int | None = None
+# tokens reserved for the answer of a call, corrected with the usage of the response afterwards
+completion_tokens = 1_000
+# SQLite file shared by all processes using the limiter (set by batch_runner.py), None keeps the limits per process
+state_file: Path | None = None
+
+# longest and shortest wait of the exponential backoff after a rate limit error without reset headers
+MAX_BACKOFF = 60.0
+MIN_BACKOFF = 1.0
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def parse_duration(value: str) -> float | None:
+    """Returns the seconds of a reset header like "1s", "6m0s" or "120ms" (None if it is not a duration)"""
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def reset_delay(headers) -> float | None:
+    """Returns the seconds until the exhausted limit resets from the headers of a rate limit response"""
+    if headers is None:
+        return None
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    retry_after = headers.get("retry-after")
+    if retry_after and retry_after.replace(".", "", 1).isdigit():
+        return float(retry_after)
+    delays = [parse_duration(headers.get(f"x-ratelimit-reset-{kind}", ""))
+              for kind in ("requests", "tokens") if headers.get(f"x-ratelimit-remaining-{kind}") == "0"]
+    delays = [delay for delay in delays if delay is not None]
+    return max(delays) if delays else None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter, retries of parallel agents do not hit the api at the same time"""
+    return random.uniform(MIN_BACKOFF, min(MAX_BACKOFF, MIN_BACKOFF * 2 ** attempt))
+
+
+def estimate_tokens(model, messages) -> int:
+    """Estimates the tokens of a call, the prompt counted with tiktoken plus the tokens reserved for the answer"""
+    # bind_tools wraps the chat model
+    chat_model = getattr(model, "bound", model)
+    try:
+        prompt_tokens = chat_model.get_num_tokens_from_messages(messages)
+    except Exception:  # pylint: disable=broad-except
+        # no tiktoken encoding for the model, about four characters per token
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4
+    return prompt_tokens + completion_tokens
+
+
+def used_tokens(response) -> int | None:
+    """Returns the tokens a response was charged, None if the api did not report them"""
+    usage = getattr(response, "usage_metadata", None)
+    return usage["total_tokens"] if usage else None
+
+
+class RateLimiter:
+    """Token buckets for the requests and the tokens per minute
+
+    The buckets refill continuously and a call waits until both have enough for it. After a rate limit error all
+    calls pause until the reset the api reported. With a state file the buckets and the pause are kept in SQLite
+    and shared by all processes.
+    """
+
+    def __init__(self, rpm: int | None, tpm: int | None, db_path: Path | None = None):
+        self.capacity = {name: limit for name, limit in (("requests", rpm), ("tokens", tpm)) if limit}
+        self._lock = threading.Lock()
+        self._state = {}
+        self._db = None
+        # without limits only the pauses after rate limit errors are left, they are kept per process instead of
+        # taking the lock of the shared file for every call
+        if db_path is not None and self.capacity:
+            # autocommit, transactions are opened explicitly with BEGIN IMMEDIATE
+            self._db = sqlite3.connect(db_path, timeout=60, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, value REAL, updated REAL)")
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Yields {name: (value, updated)} of the buckets and the pause and stores the changes"""
+        with self._lock:
+            if self._db is None:
+                yield self._state
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                state = {name: (value, updated) for name, value, updated in
+                         self._db.execute("SELECT name, value, updated FROM rate_limits")}
+                yield state
+                self._db.executemany("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?)",
+                                     [(name, value, updated) for name, (value, updated) in state.items()])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _level(self, state: dict, name: str, now: float) -> float:
+        """Level of a bucket refilled up to now"""
+        capacity = self.capacity[name]
+        value, updated = state.get(name, (capacity, now))
+        return min(capacity, value + (now - updated) * capacity / 60)
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Takes a request and the tokens from the buckets, returns the seconds to wait if they are not available"""
+        # a call larger than the whole bucket waits for a full bucket instead of forever
+        needed = {"requests": 1, "tokens": tokens}
+        needed = {name: min(needed[name], capacity) for name, capacity in self.capacity.items()}
+        with self._transaction() as state:
+            now = time.time()
+            paused_until = state.get("pause", (0.0, now))[0]
+            if paused_until > now:
+                return paused_until - now
+            levels = {name: self._level(state, name, now) for name in self.capacity}
+            wait = max([(needed[name] - level) * 60 / self.capacity[name]
+                        for name, level in levels.items() if level < needed[name]], default=0.0)
+            if wait <= 0:
+                state.update({name: (level - needed[name], now) for name, level in levels.items()})
+            return wait
+
+    def acquire(self, tokens: int):
+        """Waits until a call with the estimated tokens is within the limits"""
+        while (wait := self._try_acquire(tokens)) > 0:
+            # jitter, so waiting agents do not all start at the same moment
+            time.sleep(wait + random.uniform(0, min(1.0, wait / 10)))
+
+    def settle(self, estimated: int, used: int | None):
+        """Gives back the tokens that were reserved but not used (or takes the ones used beyond the estimate)"""
+        if used is None or "tokens" not in self.capacity:
+            return
+        with self._transaction() as state:
+            now = time.time()
+            level = self._level(state, "tokens", now) + estimated - used
+            state["tokens"] = (min(self.capacity["tokens"], level), now)
+
+    def pause(self, seconds: float):
+        """Stops all calls for the given seconds, e.g. until the reset of a rate limit"""
+        with self._transaction() as state:
+            now = time.time()
+            state["pause"] = (max(state.get("pause", (0.0, now))[0], now + seconds), now)
+
+
+def shared_limiter() -> RateLimiter:
+    """Returns the limiter of this process, created with the settings above on first use"""
+    global _limiter  # pylint: disable=global-statement
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(requests_per_minute, tokens_per_minute, state_file)
+        return _limiter
+
+
+def test(db_path: Path | None = None):
+    """Test the buckets, with 600 requests per minute the calls after the first 600 have to wait for the refill"""
+    limiter = RateLimiter(rpm=600, tpm=None, db_path=db_path)
+    start = time.time()
+    for _ in range(620):
+        limiter.acquire(0)
+    print(f"620 calls: {time.time() - start:.1f}s (expected about 2s)")
+    print(parse_duration("6m0s"), parse_duration("120ms"), reset_delay({"retry-after": "2"}))
+
+
+if __name__ == "__main__":
+    test()
@@ -1,3 +1,17 @@
 html_folder_path = ""
 
-papers = ["3445109.html", ]
\ No newline at end of file
+papers = ["3445109.html", ]
+
+# <year>_sample.csv of the quantitative filtering written with triage = True: the papers are processed from the
+# highest statistics density down and papers with a density below min_density are skipped (None keeps the order above)
+triage_csv = None
+min_density = 0.0
+
+# papers processed at the same time by batch_runner.py (1 processes them one after the other) and the limit of llm
+# requests in flight over all of them, the output of every paper is written to results/logs/<paper>.log
+workers = 1
+max_llm_requests = 4
+# requests and tokens per minute of the OpenAI account that all agents stay under (e.g. 500 and 30_000 for gpt-4o on
+# tier 1), None for no limit, see rate_limiter.py
+requests_per_minute = None
+tokens_per_minute = None
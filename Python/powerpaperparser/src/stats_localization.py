@@ -0,0 +1,96 @@
+"""Module to locate the statistics of a paper in its sections and tables
+
+The hit map runs the filters of the quantitative filtering (filter_scanner.py) here, on the parsed paper, instead of
+being written by quantitative_filtering.py: the filter stage scans the whole text of the archived HTML and knows
+nothing of sections and tables, while the map has to use exactly the section and table indices of
+PaperParser.get_section_index() and get_table_index() that the prompt lists and read_section/read_table accept.
+Scanning the parsed sections and tables takes a few milliseconds per paper, much less than one LLM call.
+"""
+import csv
+import io
+import sys
+from pathlib import Path
+
+from paper_parser import PaperParser
+
+sys.path.append(str(Path(__file__).resolve().parents[2] / "CHI_quantitative_filtering"))
+from filter_scanner import MultiPatternScanner  # noqa: E402
+
+# the filters of the quantitative filtering and what their matches are called in the prompt
+LOCALIZATION_FILTERS = {
+    "p_filter": "p-values",
+    "p_val_filter": "p-values",
+    "ci_filter": "confidence intervals",
+    "bayesian_filter": "Bayes factors",
+    "es_filter": "effect sizes",
+}
+
+
+def count_hits(scanner: MultiPatternScanner, text: str) -> dict:
+    """Returns the number of matches per kind of statistic in a text"""
+    hits = {}
+    for name, count in scanner.scan(text, counts=True).counts.items():
+        if count:
+            label = LOCALIZATION_FILTERS[name]
+            hits[label] = hits.get(label, 0) + count
+    return hits
+
+
+def table_text(title: str, table_csv: str) -> str:
+    """Returns the title and the cells of a table, every cell starts with a space like in the paper text"""
+    rows = csv.reader(io.StringIO(table_csv))
+    return title + "\n" + "\n".join(" " + " | ".join(row) for row in rows)
+
+
+def get_stats_hit_map(parser: PaperParser) -> dict:
+    """Returns the sections and tables of a paper with the number of statistics the filters found in them"""
+    scanner = MultiPatternScanner(list(LOCALIZATION_FILTERS))
+    hit_map = {"sections": [], "tables": []}
+    seen = set()
+    for section in parser.get_section_index():
+        # subsections can be listed twice, under their parent section and on their own
+        if (section["index"], section["title"]) in seen:
+            continue
+        seen.add((section["index"], section["title"]))
+        # the text includes the subsections, the same text the agent gets from read_section
+        try:
+            text = parser.get_section_text_by_index(section["index"])
+        except ValueError:
+            try:
+                text = parser.get_section_text_by_title(section["title"])
+            except ValueError:
+                continue
+        hit_map["sections"].append({**section, "hits": count_hits(scanner, " " + text)})
+    for table in parser.get_table_index():
+        title, table_csv = parser.get_table_by_index(table["index"])
+        hit_map["tables"].append({**table, "hits": count_hits(scanner, table_text(title, table_csv))})
+    return hit_map
+
+
+def format_hit_map(hit_map: dict) -> str:
+    """Returns the sections and tables with statistics as lines for the prompt"""
+    lines = []
+    for kind, entries in (("Section", hit_map["sections"]), ("Table", hit_map["tables"])):
+        for entry in entries:
+            if entry["hits"]:
+                hits = ", ".join(f"{count} {label}" for label, count in entry["hits"].items())
+                lines.append(f'{kind} {entry["index"]} "{entry["title"]}": {hits}')
+    if not lines:
+        return "The keyword search found no statistics in the sections or tables."
+    return "\n".join(lines)
+
+
+def test(path: Path):
+    """Test the statistics localization"""
+    print(f"Testing: {path}")
+    parser = PaperParser(path)
+    hit_map = get_stats_hit_map(parser)
+    print(hit_map)
+    print("=" * 80)
+    print(format_hit_map(hit_map))
+
+
+if __name__ == "__main__":
+    folder = Path("")
+    paper = folder / "3580810.html"
+    test(paper)